@@ -1,58 +1,400 @@
-from datetime import date
-from fastapi import APIRouter, Depends, Query
+import csv
+import heapq
+import io
+import json
+from contextlib import ExitStack
+from datetime import date, timedelta
+from itertools import islice
+from typing import Iterator, Literal, NamedTuple
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from sqlalchemy import select, and_
-from app.deps import get_db
+from sqlalchemy import select, and_, tuple_, literal, union_all, type_coerce, Float
+from app.database import SessionLocal, USE_ASYNC_DB, SHARDED, SHARD_COUNT, ShardSessionLocal
+from app.deps import get_db, get_async_db
 from app.models import WeatherRecord, Station
-from app.schemas import WeatherRecordOut
-from app.utils import as_celsius, as_mm
+from app.schemas import WeatherRecordOut, BatchRequest, BatchResultOut, BatchResponse
+from app.shards import shard_for, shard_session, fan_out, fan_out_sorted
+from app.snapshot import get_snapshot
+from app.stations import station_index
+from app.utils import as_celsius, as_mm, encode_cursor, decode_cursor, dumps_json
 
 # Router for raw daily weather records
 router = APIRouter(prefix="/api/weather", tags=["weather"])
 
-@router.get("", response_model=list[WeatherRecordOut])
-def list_weather(
-    db: Session = Depends(get_db),                     # DB session per request
+# Response header carrying the keyset cursor for the next page
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+# Rows fetched from the DB cursor per chunk when streaming exports
+EXPORT_CHUNK_SIZE = 5000
+
+# Column order shared by list responses and exports
+RECORD_FIELDS = ("station", "date", "tmax_c", "tmin_c", "prcp_mm")
+
+EXPORT_MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# Measurements converted to API units in SQL (tenths -> °C / mm, same float division as as_celsius/as_mm)
+RECORD_VALUE_COLUMNS = (
+    type_coerce(WeatherRecord.tmax_tenths_c / 10.0, Float).label("tmax_c"),
+    type_coerce(WeatherRecord.tmin_tenths_c / 10.0, Float).label("tmin_c"),
+    type_coerce(WeatherRecord.prcp_tenths_mm / 10.0, Float).label("prcp_mm"),
+)
+
+
+# WHERE conditions shared by list and export endpoints (on_date takes precedence over the range)
+def _record_filters(station: str | None, on_date: date | None, start_date: date | None, end_date: date | None) -> list:
+    conds = []
+    if station:
+        # Filter on the indexed station_id directly when the code is in the warmed-up station index; the code
+        # condition stays so a stale index entry (station recreated since warm-up) can't match another station
+        conds.append(Station.code == station)
+        station_id = station_index.get(station)
+        if station_id is not None:
+            conds.append(WeatherRecord.station_id == station_id)
+    if on_date:
+        conds.append(WeatherRecord.date == on_date)
+    else:
+        if start_date:
+            conds.append(WeatherRecord.date >= start_date)
+        if end_date:
+            conds.append(WeatherRecord.date <= end_date)
+    return conds
+
+
+# Decode a pagination cursor into (date, station_id), or raise 400.
+# (station_id, date) is unique, so it totally orders records in both storage layouts;
+# a trailing record id from older cursors is ignored.
+def _parse_cursor(cursor: str) -> tuple[date, int]:
+    try:
+        d, station_id, *_ = decode_cursor(cursor)
+        return date.fromisoformat(d), int(station_id)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+
+# Validated query parameters of GET /api/weather (shared by the sync and async handlers)
+class RecordQuery(NamedTuple):
+    station: str | None
+    on_date: date | None
+    start_date: date | None
+    end_date: date | None
+    limit: int
+    offset: int
+    after: tuple[date, int] | None  # decoded keyset cursor
+
+
+def record_query(
     station: str | None = Query(None, description="Station code"),  # optional station filter
     on_date: date | None = Query(None, description="Exact date YYYY-MM-DD"),  # exact-date filter (takes precedence)
     start_date: date | None = Query(None),            # date-range start (used only if on_date not provided)
     end_date: date | None = Query(None),              # date-range end (used only if on_date not provided)
     limit: int = Query(100, ge=1, le=1000),          # pagination: page size
     offset: int = Query(0, ge=0),                    # pagination: page offset
-):
+    cursor: str | None = Query(None, description=f"Opaque keyset cursor from the {NEXT_CURSOR_HEADER} header"),
+) -> RecordQuery:
+    if cursor and offset:
+        raise HTTPException(status_code=400, detail="Use either cursor or offset, not both")
+    after = _parse_cursor(cursor) if cursor else None
+    return RecordQuery(station, on_date, start_date, end_date, limit, offset, after)
+
+
+# Station-filtered reads are served from the memory-mapped snapshot when one is configured (None = use the DB)
+def _snapshot_rows(q: RecordQuery) -> list[tuple] | None:
+    snapshot = get_snapshot() if q.station else None
+    if snapshot is None:
+        return None
+    return snapshot.query(q.station, q.on_date, q.start_date, q.end_date, q.after, q.limit, q.offset)
+
+
+# DB path for list_weather: rows of (code, date, tmax_c, tmin_c, prcp_mm, station_id) in API sort order
+def _records_stmt(q: RecordQuery):
     # Base query joining records to station codes (denormalized for response)
     stmt = (
-        select(WeatherRecord, Station.code)
+        select(
+            Station.code,
+            WeatherRecord.date,
+            *RECORD_VALUE_COLUMNS,
+            WeatherRecord.station_id,
+        )
         .join(Station, Station.id == WeatherRecord.station_id)
     )
 
     # Build WHERE conditions dynamically from supplied filters
-    conds = []
-    if station:
-        conds.append(Station.code == station)
-    if on_date:
-        conds.append(WeatherRecord.date == on_date)
-    else:
-        if start_date:
-            conds.append(WeatherRecord.date >= start_date)
-        if end_date:
-            conds.append(WeatherRecord.date <= end_date)
+    conds = _record_filters(q.station, q.on_date, q.start_date, q.end_date)
+    if q.after:
+        # Seek past the last row of the previous page; the plain date bound keeps it an index range scan
+        c_date, c_station_id = q.after
+        conds.append(WeatherRecord.date >= c_date)
+        conds.append(
+            tuple_(WeatherRecord.date, WeatherRecord.station_id)
+            > tuple_(literal(c_date, WeatherRecord.date.type), c_station_id)  # bind with the column's date storage
+        )
     if conds:
         stmt = stmt.where(and_(*conds))
 
-    # Stable sort by date; apply pagination
-    stmt = stmt.order_by(WeatherRecord.date).limit(limit).offset(offset)
+    # Total, stable sort (date, station); apply pagination
+    stmt = stmt.order_by(WeatherRecord.date, WeatherRecord.station_id).limit(q.limit)
+    if q.offset:
+        stmt = stmt.offset(q.offset)
+    return stmt
 
-    rows = db.execute(stmt).all()
 
-    # Map ORM rows to API schema, converting stored tenths to human units
-    return [
-        WeatherRecordOut(
-            station=code,
-            date=rec.date,
-            tmax_c=as_celsius(rec.tmax_tenths_c),
-            tmin_c=as_celsius(rec.tmin_tenths_c),
-            prcp_mm=as_mm(rec.prcp_tenths_mm),
-        )
-        for rec, code in rows
+# Build the page response from rows already in API units: the next-page cursor header plus the JSON body,
+# encoded straight from plain dicts (same JSON as list[WeatherRecordOut], without per-row Pydantic models)
+def _records_page(rows: list[tuple], limit: int) -> Response:
+    headers = {}
+    # A full page may have more rows after it: hand out a cursor positioned at its last row
+    if len(rows) == limit:
+        _, last_date, *_, last_station_id = rows[-1]
+        headers[NEXT_CURSOR_HEADER] = encode_cursor([last_date.isoformat(), last_station_id])
+
+    body = dumps_json([
+        {"station": code, "date": d, "tmax_c": tmax, "tmin_c": tmin, "prcp_mm": prcp}
+        for code, d, tmax, tmin, prcp, _ in rows
+    ])
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def list_weather(
+    db: Session = Depends(get_db),  # DB session per request
+    q: RecordQuery = Depends(record_query),
+):
+    rows = _snapshot_rows(q)
+    if rows is None:
+        rows = db.execute(_records_stmt(q)).all()
+    return _records_page(rows, q.limit)
+
+
+async def list_weather_async(
+    db=Depends(get_async_db),  # AsyncSession per request (sqlalchemy.ext.asyncio imported lazily)
+    q: RecordQuery = Depends(record_query),
+):
+    rows = _snapshot_rows(q)
+    if rows is None:
+        rows = (await db.execute(_records_stmt(q))).all()
+    return _records_page(rows, q.limit)
+
+
+# One statement per filter/pagination shape list_weather builds, for app.warmup: executing them once
+# compiles them into the engine's statement cache before the first request (station: any known code)
+def warmup_statements(station: str | None, day: date) -> list:
+    base = RecordQuery(None, None, None, None, 1, 0, None)
+    queries = [
+        base,
+        base._replace(on_date=day),
+        base._replace(start_date=day, end_date=day),
+        base._replace(start_date=day),
+        base._replace(after=(day, 0)),
+        base._replace(offset=1),
     ]
+    if station:
+        queries += [
+            base._replace(station=station),
+            base._replace(station=station, start_date=day, end_date=day),
+            base._replace(station=station, after=(day, 0)),
+        ]
+    return [_records_stmt(q) for q in queries]
+
+
+# Sort key of _records_stmt rows: (date, station_id)
+def _record_order(row) -> tuple:
+    return row[1], row[-1]
+
+
+# Sharded DB: a station filter reads the station's shard only; otherwise every shard returns its first
+# offset + limit rows and the sorted streams are merged, giving the same page as a single DB
+def list_weather_sharded(q: RecordQuery = Depends(record_query)):
+    rows = _snapshot_rows(q)
+    if rows is None:
+        if q.station:
+            with shard_session(q.station) as db:
+                rows = db.execute(_records_stmt(q)).all()
+        else:
+            stmt = _records_stmt(q._replace(limit=q.offset + q.limit, offset=0))
+            rows = fan_out_sorted(stmt, _record_order, q.limit, q.offset)
+    return _records_page(rows, q.limit)
+
+
+# Same path and schema either way; SHARD_COUNT / DB_ASYNC pick the handler. Handlers return ready JSON,
+# response_model only documents it in OpenAPI.
+router.add_api_route(
+    "",
+    list_weather_sharded if SHARDED else list_weather_async if USE_ASYNC_DB else list_weather,
+    methods=["GET"],
+    response_model=list[WeatherRecordOut],
+    name="list_weather",
+)
+
+
+# Resolve all selector station codes to ids in one lookup (not from the station index: the record branches
+# filter on station_id alone, so a stale index entry would return another station's rows)
+def _batch_station_ids_stmt(body: BatchRequest):
+    return select(Station.code, Station.id).where(Station.code.in_({s.station for s in body.selectors}))
+
+
+# All selectors as one UNION ALL statement: each branch is an index range scan on (station_id, date),
+# limited to limit + 1 rows so truncation can be detected. Rows come back as (selector index, date, values...).
+def _batch_records_stmt(body: BatchRequest, station_ids: dict[str, int]):
+    branches = []
+    for i, sel in enumerate(body.selectors):
+        station_id = station_ids.get(sel.station)
+        if station_id is None:
+            continue
+        conds = [WeatherRecord.station_id == station_id]
+        if sel.start_date:
+            conds.append(WeatherRecord.date >= sel.start_date)
+        if sel.end_date:
+            conds.append(WeatherRecord.date <= sel.end_date)
+        # SQLite only allows ORDER BY/LIMIT inside a compound member when wrapped in a subquery
+        sub = (
+            select(
+                literal(i).label("sel"),
+                WeatherRecord.date,
+                WeatherRecord.tmax_tenths_c,
+                WeatherRecord.tmin_tenths_c,
+                WeatherRecord.prcp_tenths_mm,
+            )
+            .where(and_(*conds))
+            .order_by(WeatherRecord.date)
+            .limit(sel.limit + 1)
+            .subquery()
+        )
+        branches.append(select(sub))
+    if not branches:
+        return None
+    combined = union_all(*branches).subquery()
+    return select(combined).order_by(combined.c.sel, combined.c.date)
+
+
+# Group the union rows back per selector, in request order
+def _batch_response(body: BatchRequest, station_ids: dict[str, int], rows) -> BatchResponse:
+    grouped: list[list] = [[] for _ in body.selectors]
+    for sel, d, tmax, tmin, prcp in rows:
+        grouped[sel].append((d, tmax, tmin, prcp))
+
+    results = []
+    for sel, recs in zip(body.selectors, grouped):
+        # One extra row was fetched: its presence means there is more after the last returned date
+        next_start = None
+        if len(recs) > sel.limit:
+            recs = recs[:sel.limit]
+            next_start = recs[-1][0] + timedelta(days=1)
+        results.append(BatchResultOut(
+            station=sel.station,
+            start_date=sel.start_date,
+            end_date=sel.end_date,
+            records=[
+                WeatherRecordOut(station=sel.station, date=d, tmax_c=as_celsius(tmax), tmin_c=as_celsius(tmin), prcp_mm=as_mm(prcp))
+                for d, tmax, tmin, prcp in recs
+            ],
+            next_start_date=next_start,
+        ))
+    unknown = sorted({s.station for s in body.selectors} - station_ids.keys())
+    return BatchResponse(results=results, unknown_stations=unknown)
+
+
+def batch_weather(body: BatchRequest, db: Session = Depends(get_db)):
+    station_ids = dict(db.execute(_batch_station_ids_stmt(body)).all())
+    stmt = _batch_records_stmt(body, station_ids)
+    rows = db.execute(stmt).all() if stmt is not None else []
+    return _batch_response(body, station_ids, rows)
+
+
+async def batch_weather_async(body: BatchRequest, db=Depends(get_async_db)):
+    station_ids = dict((await db.execute(_batch_station_ids_stmt(body))).all())
+    stmt = _batch_records_stmt(body, station_ids)
+    rows = (await db.execute(stmt)).all() if stmt is not None else []
+    return _batch_response(body, station_ids, rows)
+
+
+# Sharded DB: ids come from the catalog; each shard runs the UNION ALL of its own stations' selectors
+def batch_weather_sharded(body: BatchRequest, db: Session = Depends(get_db)):
+    station_ids = dict(db.execute(_batch_station_ids_stmt(body)).all())
+    by_shard: dict[int, dict[str, int]] = {}
+    for code, station_id in station_ids.items():
+        by_shard.setdefault(shard_for(code), {})[code] = station_id
+    stmts = {shard: _batch_records_stmt(body, ids) for shard, ids in by_shard.items()}
+    results = fan_out(lambda s: s.execute(stmts[s.info["shard"]]).all(), stmts) if stmts else []
+    # Selector indexes are disjoint between shards and each result is sorted by (selector, date)
+    rows = list(heapq.merge(*results, key=lambda r: (r[0], r[1])))
+    return _batch_response(body, station_ids, rows)
+
+
+# Many station/date-range selectors in one request: two SQL statements per shard regardless of selector count
+router.add_api_route(
+    "/batch",
+    batch_weather_sharded if SHARDED else batch_weather_async if USE_ASYNC_DB else batch_weather,
+    methods=["POST"],
+    response_model=BatchResponse,
+    name="batch_weather",
+)
+
+
+# Chunks of rows from a sorted stream; a sharded export merges one server-side cursor per shard
+def _export_chunks(stmt, station: str | None) -> Iterator[list]:
+    with ExitStack() as stack:
+        if not SHARDED:
+            yield from stack.enter_context(SessionLocal()).execute(stmt).partitions()
+            return
+        shards = [shard_for(station)] if station else range(SHARD_COUNT)
+        streams = [stack.enter_context(ShardSessionLocal[i]()).execute(stmt) for i in shards]
+        rows = heapq.merge(*streams, key=lambda r: (r[1], r[-1]))  # (date, station_id)
+        while chunk := list(islice(rows, EXPORT_CHUNK_SIZE)):
+            yield chunk
+
+
+# Stream export rows chunk by chunk from a server-side cursor, never holding the full result.
+# Opens its own session: the request-scoped one may be closed before the body is streamed.
+def _export_rows(conds: list, fmt: str, station: str | None = None) -> Iterator[str]:
+    stmt = (
+        select(
+            Station.code,
+            WeatherRecord.date,
+            WeatherRecord.tmax_tenths_c,
+            WeatherRecord.tmin_tenths_c,
+            WeatherRecord.prcp_tenths_mm,
+            WeatherRecord.station_id,
+        )
+        .join(Station, Station.id == WeatherRecord.station_id)
+        .order_by(WeatherRecord.date, WeatherRecord.station_id)
+        .execution_options(yield_per=EXPORT_CHUNK_SIZE)
+    )
+    if conds:
+        stmt = stmt.where(and_(*conds))
+
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf, lineterminator="\n")
+        writer.writerow(RECORD_FIELDS)
+    for chunk in _export_chunks(stmt, station):
+        rows = [
+            (code, d.isoformat(), as_celsius(tmax), as_celsius(tmin), as_mm(prcp))
+            for code, d, tmax, tmin, prcp, _ in chunk
+        ]
+        if fmt == "csv":
+            # Missing values become empty cells
+            writer.writerows(rows)
+            yield buf.getvalue()
+            buf.seek(0)
+            buf.truncate()
+        else:
+            yield "".join(json.dumps(dict(zip(RECORD_FIELDS, r))) + "\n" for r in rows)
+    if fmt == "csv" and buf.tell():
+        yield buf.getvalue()
+
+
+@router.get("/export", response_class=StreamingResponse)
+def export_weather(
+    format: Literal["ndjson", "csv"] = Query("ndjson", description="ndjson (one JSON record per line) or csv"),
+    station: str | None = Query(None, description="Station code"),
+    on_date: date | None = Query(None, description="Exact date YYYY-MM-DD"),
+    start_date: date | None = Query(None),
+    end_date: date | None = Query(None),
+):
+    # Bulk dump of raw records with the list_weather filters, streamed with flat memory use
+    conds = _record_filters(station, on_date, start_date, end_date)
+    return StreamingResponse(
+        _export_rows(conds, format, station),
+        media_type=EXPORT_MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="weather.{format}"'},
+    )
@@ -1,53 +1,296 @@
-from fastapi import APIRouter, Depends, Query
+import hashlib
+from typing import Literal
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
 from sqlalchemy import select, and_
-from app.deps import get_db
-from app.models import WeatherStat, Station
-from app.schemas import WeatherStatOut
+from app.cache import stats_cache, get_stats_generation, STATS_GENERATION_QUERY
+from app.database import USE_ASYNC_DB, SHARDED
+from app.deps import get_db, get_async_db
+from app.models import WeatherStat, WeatherStatMonthly, WeatherStatDecade, WeatherSketch, Station
+from app.shards import shard_for, shard_session, fan_out, fan_out_sorted
+from app.sketches import ValueSketch
+from app.stations import station_index
+from app.utils import dumps_json
+from app.schemas import (
+    WeatherStatOut, WeatherStatMonthOut, WeatherStatDecadeOut, WeatherStatPercentilesOut, CacheInfoOut, YearSummaryOut,
+)
+from app.stats_matrix import get_stats_matrix
 
 # Router for yearly weather statistics endpoints
 router = APIRouter(prefix="/api/weather/stats", tags=["weather-stats"])
 
-@router.get("", response_model=list[WeatherStatOut])
-def list_weather_stats(
-    db: Session = Depends(get_db),  # Inject DB session
-    station: str | None = Query(None, description="Station code"),  # Optional station filter
-    year: int | None = Query(None, ge=1985, le=2014),  # Optional year filter, matches dataset range
-    limit: int = Query(100, ge=1, le=1000),  # Pagination limit
-    offset: int = Query(0, ge=0),  # Pagination offset
-):
-    # Base query joining stats with station codes
+Granularity = Literal["month", "year", "decade"]
+
+# Rollup table, output schema and period columns (in sort order) per granularity
+ROLLUPS = {
+    "year": (WeatherStat, WeatherStatOut, ("year",)),
+    "month": (WeatherStatMonthly, WeatherStatMonthOut, ("year", "month")),
+    "decade": (WeatherStatDecade, WeatherStatDecadeOut, ("decade",)),
+}
+
+# Aggregate columns returned after the station code and period columns
+STAT_FIELDS = ("avg_tmax_c", "avg_tmin_c", "total_prcp_cm", "count_tmax", "count_tmin", "count_prcp")
+
+# Sketch metric -> key in the percentiles object (values in API units: tenths / 10)
+PERCENTILE_METRICS = {"tmax": "tmax_c", "tmin": "tmin_c", "prcp": "prcp_mm"}
+MAX_PERCENTILES = 10
+PERCENTILES_HELP = "Comma-separated percentiles (0-100), e.g. 50,95; year granularity only, exact (nearest-rank)"
+
+# Union of the per-granularity list schemas, for OpenAPI
+StatsResponse = (
+    list[WeatherStatOut] | list[WeatherStatPercentilesOut] | list[WeatherStatMonthOut] | list[WeatherStatDecadeOut]
+)
+
+
+# ETag for a normalized query at a given stats generation
+def _etag(generation: int, key: tuple) -> str:
+    return '"%d-%s"' % (generation, hashlib.sha1(repr(key).encode()).hexdigest()[:16])
+
+
+# True if the If-None-Match header lists this ETag (weak or strong) or "*"
+def _etag_matches(if_none_match: str | None, etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [t.strip().removeprefix("W/") for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
+
+# Normalized cache key for a stats query
+def _cache_key(
+    granularity: str, station: str | None, year: int | None, limit: int, offset: int, percentiles: tuple = ()
+) -> tuple:
+    return (granularity, station or None, year, limit, offset, percentiles)
+
+
+# "50,95" -> (50.0, 95.0); percentiles come from yearly sketches, so other granularities are rejected
+def _parse_percentiles(value: str | None, granularity: str) -> tuple[float, ...]:
+    if not value:
+        return ()
+    if granularity != "year":
+        raise HTTPException(status_code=400, detail="percentiles are only available with granularity=year")
+    try:
+        ps = tuple(sorted({float(p) for p in value.split(",") if p.strip()}))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid percentiles")
+    if not ps or len(ps) > MAX_PERCENTILES or not all(0 <= p <= 100 for p in ps):
+        raise HTTPException(
+            status_code=400, detail=f"percentiles must be 1-{MAX_PERCENTILES} values between 0 and 100"
+        )
+    return ps
+
+
+# 304 or cached body for this query at this generation, plus the headers every response carries
+def _cached_response(request: Request, generation: int, key: tuple) -> tuple[Response | None, dict]:
+    # Responses only change when compute_stats bumps the generation: drop older cache entries
+    stats_cache.sync(generation)
+    headers = {"ETag": _etag(generation, key), "Cache-Control": "no-cache"}
+
+    # Conditional request for an unchanged result
+    if _etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers), headers
+
+    body = stats_cache.get(key)
+    if body is not None:
+        return Response(content=body, media_type="application/json", headers={**headers, "X-Cache": "HIT"}), headers
+    return None, headers
+
+
+def _stats_stmt(granularity: str, station: str | None, year: int | None, limit: int, offset: int):
+    model, _, periods = ROLLUPS[granularity]
+
+    # Only the response columns, in response field order: code, period columns, aggregates
     stmt = (
-        select(WeatherStat, Station.code)
-        .join(Station, Station.id == WeatherStat.station_id)
+        select(Station.code, *(getattr(model, c) for c in (*periods, *STAT_FIELDS)))
+        .join(Station, Station.id == model.station_id)
     )
 
-    # Build dynamic WHERE conditions based on filters
+    # Build dynamic WHERE conditions based on filters (decade rollups match the decade containing `year`)
     conds = []
     if station:
+        # Indexed station_id filter when the code is in the warmed-up station index, alongside the code
+        # condition so a stale index entry can't match another station
         conds.append(Station.code == station)
+        station_id = station_index.get(station)
+        if station_id is not None:
+            conds.append(model.station_id == station_id)
     if year is not None:
-        conds.append(WeatherStat.year == year)
+        if granularity == "decade":
+            conds.append(model.decade == year // 10 * 10)
+        else:
+            conds.append(model.year == year)
     if conds:
         stmt = stmt.where(and_(*conds))
 
     # Apply ordering and pagination
-    stmt = stmt.order_by(Station.code, WeatherStat.year).limit(limit).offset(offset)
-
-    # Execute query
-    rows = db.execute(stmt).all()
-
-    # Transform ORM results into Pydantic response models
-    return [
-        WeatherStatOut(
-            station=code,
-            year=stat.year,
-            avg_tmax_c=stat.avg_tmax_c,
-            avg_tmin_c=stat.avg_tmin_c,
-            total_prcp_cm=stat.total_prcp_cm,
-            count_tmax=stat.count_tmax,
-            count_tmin=stat.count_tmin,
-            count_prcp=stat.count_prcp,
-        )
-        for stat, code in rows
-    ]
+    order = [Station.code, *(getattr(model, p) for p in periods)]
+    return stmt.order_by(*order).limit(limit).offset(offset)
+
+
+# Stats statements for app.warmup (see weather.warmup_statements): every granularity, with and
+# without the station and year filters and an offset
+def warmup_statements(station: str | None, year: int) -> list:
+    stmts = []
+    for granularity in ROLLUPS:
+        stmts += [
+            _stats_stmt(granularity, None, None, 1, 0),
+            _stats_stmt(granularity, None, year, 1, 0),
+            _stats_stmt(granularity, None, None, 1, 1),
+        ]
+        if station:
+            stmts += [_stats_stmt(granularity, station, None, 1, 0), _stats_stmt(granularity, station, year, 1, 0)]
+    if station:
+        stmts.append(_sketches_stmt([(station, year)]))
+    return stmts
+
+
+# Persisted sketches for a page of yearly stats. Filtering codes and years separately lets SQLite seek
+# stations by code and sketches by primary key; pairs not on the page are ignored when merging.
+def _sketches_stmt(rows):
+    return (
+        select(Station.code, WeatherSketch.year, WeatherSketch.metric, WeatherSketch.data)
+        .join(Station, Station.id == WeatherSketch.station_id)
+        .where(Station.code.in_({row[0] for row in rows}), WeatherSketch.year.in_({row[1] for row in rows}))
+    )
+
+
+# Percentiles object per (station code, year), evaluated from the sketches (no weather_records scan)
+def _percentiles_by_key(sketch_rows, ps: tuple[float, ...]) -> dict[tuple[str, int], dict]:
+    labels = [f"{p:g}" for p in ps]
+    out = {}
+    for code, year, metric, data in sketch_rows:
+        values = ValueSketch.from_bytes(data).percentiles(list(ps))
+        out.setdefault((code, year), {})[PERCENTILE_METRICS[metric]] = {
+            label: None if v is None else v / 10.0 for label, v in zip(labels, values)
+        }
+    return out
+
+
+# Serialize freshly queried rows, store them in the cache and build the response.
+# Rows map positionally onto the output schema, so they are encoded as dicts without Pydantic models.
+def _fresh_response(
+    granularity: str, rows, key: tuple, generation: int, headers: dict,
+    percentiles: dict[tuple[str, int], dict] | None = None,
+) -> Response:
+    _, _, periods = ROLLUPS[granularity]
+    fields = ("station", *periods, *STAT_FIELDS)
+    items = [dict(zip(fields, row)) for row in rows]
+    if percentiles is not None:
+        # Station-years without sketches (ingested before sketches existed) get all-None percentiles
+        labels = [f"{p:g}" for p in key[-1]]
+        empty = dict.fromkeys(labels)
+        for item in items:
+            found = percentiles.get((item["station"], item["year"]), {})
+            item["percentiles"] = {name: found.get(name, empty) for name in PERCENTILE_METRICS.values()}
+    body = dumps_json(items)
+    stats_cache.put(key, body, generation)
+    return Response(content=body, media_type="application/json", headers={**headers, "X-Cache": "MISS"})
+
+
+def list_weather_stats(
+    request: Request,
+    db: Session = Depends(get_db),  # Inject DB session
+    station: str | None = Query(None, description="Station code"),  # Optional station filter
+    year: int | None = Query(None, ge=1985, le=2014),  # Optional year filter, matches dataset range
+    limit: int = Query(100, ge=1, le=1000),  # Pagination limit
+    offset: int = Query(0, ge=0),  # Pagination offset
+    granularity: Granularity = Query("year", description="Rollup period: month, year or decade"),
+    percentiles: str | None = Query(None, description=PERCENTILES_HELP),
+):
+    ps = _parse_percentiles(percentiles, granularity)
+    generation = get_stats_generation(db)
+    key = _cache_key(granularity, station, year, limit, offset, ps)
+    cached, headers = _cached_response(request, generation, key)
+    if cached is not None:
+        return cached
+    rows = db.execute(_stats_stmt(granularity, station, year, limit, offset)).all()
+    found = None
+    if ps:
+        found = _percentiles_by_key(db.execute(_sketches_stmt(rows)).all() if rows else [], ps)
+    return _fresh_response(granularity, rows, key, generation, headers, found)
+
+
+async def list_weather_stats_async(
+    request: Request,
+    db=Depends(get_async_db),  # AsyncSession per request (sqlalchemy.ext.asyncio imported lazily)
+    station: str | None = Query(None, description="Station code"),
+    year: int | None = Query(None, ge=1985, le=2014),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    granularity: Granularity = Query("year", description="Rollup period: month, year or decade"),
+    percentiles: str | None = Query(None, description=PERCENTILES_HELP),
+):
+    ps = _parse_percentiles(percentiles, granularity)
+    generation = (await db.execute(STATS_GENERATION_QUERY)).scalar_one_or_none() or 0
+    key = _cache_key(granularity, station, year, limit, offset, ps)
+    cached, headers = _cached_response(request, generation, key)
+    if cached is not None:
+        return cached
+    rows = (await db.execute(_stats_stmt(granularity, station, year, limit, offset))).all()
+    found = None
+    if ps:
+        found = _percentiles_by_key((await db.execute(_sketches_stmt(rows))).all() if rows else [], ps)
+    return _fresh_response(granularity, rows, key, generation, headers, found)
+
+
+# Sharded DB: the generation comes from the catalog; a station filter reads one shard, otherwise each shard
+# returns its first offset + limit rows and they are merged in (station code, period) order
+def list_weather_stats_sharded(
+    request: Request,
+    db: Session = Depends(get_db),  # catalog session
+    station: str | None = Query(None, description="Station code"),
+    year: int | None = Query(None, ge=1985, le=2014),
+    limit: int = Query(100, ge=1, le=1000),
+    offset: int = Query(0, ge=0),
+    granularity: Granularity = Query("year", description="Rollup period: month, year or decade"),
+    percentiles: str | None = Query(None, description=PERCENTILES_HELP),
+):
+    ps = _parse_percentiles(percentiles, granularity)
+    generation = get_stats_generation(db)
+    key = _cache_key(granularity, station, year, limit, offset, ps)
+    cached, headers = _cached_response(request, generation, key)
+    if cached is not None:
+        return cached
+    if station:
+        with shard_session(station) as shard_db:
+            rows = shard_db.execute(_stats_stmt(granularity, station, year, limit, offset)).all()
+    else:
+        n_periods = len(ROLLUPS[granularity][2])
+        stmt = _stats_stmt(granularity, None, year, offset + limit, 0)
+        rows = fan_out_sorted(stmt, lambda r: r[:1 + n_periods], limit, offset)
+    found = None
+    if ps:
+        by_shard: dict[int, list] = {}
+        for row in rows:
+            by_shard.setdefault(shard_for(row[0]), []).append(row)
+        sketch_rows = fan_out(lambda s: s.execute(_sketches_stmt(by_shard[s.info["shard"]])).all(), by_shard)
+        found = _percentiles_by_key([r for part in sketch_rows for r in part], ps)
+    return _fresh_response(granularity, rows, key, generation, headers, found)
+
+
+# Same path and schema either way; SHARD_COUNT / DB_ASYNC pick the handler
+router.add_api_route(
+    "",
+    list_weather_stats_sharded if SHARDED else list_weather_stats_async if USE_ASYNC_DB else list_weather_stats,
+    methods=["GET"],
+    response_model=StatsResponse,
+    name="list_weather_stats",
+)
+
+
+@router.get("/summary", response_model=list[YearSummaryOut])
+def weather_stats_summary(
+    db: Session = Depends(get_db),
+    metric: Literal["avg_tmax_c", "avg_tmin_c", "total_prcp_cm"] = Query("avg_tmax_c", description="weather_stats column"),
+    year: list[int] | None = Query(None, description="Year(s) to summarize (repeatable); all years if omitted"),
+    top: int = Query(10, ge=0, le=1000, description="Number of ranked stations per year"),
+    order: Literal["desc", "asc"] = Query("desc", description="desc: highest values first (e.g. wettest)"),
+):
+    # Cross-station aggregates and top-N rankings per year, answered from the in-memory station × year matrix
+    matrix = get_stats_matrix(db)
+    return matrix.summarize(metric, sorted(set(year)) if year else None, top, order == "desc")
+
+
+@router.get("/cache", response_model=CacheInfoOut)
+def stats_cache_info():
+    # Cache hit/miss counters for observability
+    return stats_cache.info()
@@ -0,0 +1,82 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Hashable
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from app.models import AppMeta
+
+# app_meta key bumped by scripts/compute_stats.py whenever weather_stats changes
+STATS_GENERATION_KEY = "stats_generation"
+
+# Max cached stats responses (env override)
+STATS_CACHE_SIZE = int(os.getenv("STATS_CACHE_SIZE", "256"))
+
+
+# Query for the current stats generation (no row = 0, stats never computed)
+STATS_GENERATION_QUERY = select(AppMeta.value).where(AppMeta.key == STATS_GENERATION_KEY)
+
+
+# Read the current stats generation
+def get_stats_generation(db: Session) -> int:
+    return db.execute(STATS_GENERATION_QUERY).scalar_one_or_none() or 0
+
+
+# Increment the stats generation inside the caller's transaction (commit makes it visible)
+def bump_stats_generation(db: Session) -> None:
+    stmt = sqlite_insert(AppMeta).values(key=STATS_GENERATION_KEY, value=1)
+    db.execute(stmt.on_conflict_do_update(index_elements=["key"], set_={"value": AppMeta.value + 1}))
+
+
+# Thread-safe bounded LRU of serialized responses, dropped wholesale when the data generation changes
+class ResponseCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self.generation: int | None = None
+        self.hits = 0
+        self.misses = 0
+        self._data: OrderedDict[Hashable, bytes] = OrderedDict()
+        self._lock = threading.Lock()
+
+    # Clear entries if they were built from an older generation
+    def sync(self, generation: int) -> None:
+        with self._lock:
+            if generation != self.generation:
+                self._data.clear()
+                self.generation = generation
+
+    def get(self, key: Hashable) -> bytes | None:
+        with self._lock:
+            body = self._data.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: Hashable, body: bytes, generation: int) -> None:
+        with self._lock:
+            if generation != self.generation or self.maxsize <= 0:
+                return  # stale result computed across an invalidation
+            self._data[key] = body
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def info(self) -> dict:
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "generation": self.generation,
+            }
+
+
+# Process-wide cache for /api/weather/stats responses
+stats_cache = ResponseCache(STATS_CACHE_SIZE)
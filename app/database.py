@@ -1,20 +1,109 @@
 import os
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.orm import sessionmaker, declarative_base
+from app.metrics import instrument_engine
 
 # Get DB connection URL from environment, default to local SQLite file
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./weather.db")
 
+# Serve the list endpoints from async handlers on an async engine (DB_ASYNC=1; needs aiosqlite for SQLite)
+USE_ASYNC_DB = os.getenv("DB_ASYNC", "0").lower() in ("1", "true", "yes")
+
+# Async driver URL; derived from DATABASE_URL for SQLite, set ASYNC_DATABASE_URL explicitly for other DBs
+ASYNC_DATABASE_URL = os.getenv("ASYNC_DATABASE_URL") or DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+
+# weather_records storage: "standard" (surrogate id + secondary indexes) or "compact" (WITHOUT ROWID table
+# clustered on (station_id, date), dates as integer day numbers). Convert existing DBs with scripts.migrate_schema.
+RECORDS_LAYOUT = os.getenv("RECORDS_LAYOUT", "standard")
+if RECORDS_LAYOUT not in ("standard", "compact"):
+    raise ValueError(f"RECORDS_LAYOUT must be 'standard' or 'compact', got {RECORDS_LAYOUT!r}")
+
+# Hash-partition stations across SHARD_COUNT SQLite files (1 = single DB). When sharded, DATABASE_URL holds the
+# catalog (stations with their global ids, app_meta, ingest_manifest) and each shard URL is SHARD_URL_TEMPLATE
+# with {shard} replaced by 0..SHARD_COUNT-1 (default: DATABASE_URL's file name with a .shard{shard} suffix).
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "1"))
+if SHARD_COUNT < 1:
+    raise ValueError(f"SHARD_COUNT must be >= 1, got {SHARD_COUNT}")
+SHARDED = SHARD_COUNT > 1
+_root, _ext = os.path.splitext(DATABASE_URL)
+SHARD_URL_TEMPLATE = os.getenv("SHARD_URL_TEMPLATE") or f"{_root}.shard{{shard}}{_ext}"
+if SHARDED and USE_ASYNC_DB:
+    raise ValueError("DB_ASYNC is not supported with SHARD_COUNT > 1")
+
+# Connection pool sizing (file-based SQLite and server DBs). Sync endpoints run in Starlette's
+# 40-thread pool and release sessions in a threadpool teardown, so a smaller pool can stall under load.
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "40"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+
+# PRAGMAs applied to every new SQLite connection; set a variable to "" to leave SQLite's default.
+# WAL lets API readers proceed while the ingest/stats scripts hold the write lock.
+SQLITE_PRAGMAS = {
+    "journal_mode": os.getenv("SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.getenv("SQLITE_SYNCHRONOUS", "NORMAL"),
+    "cache_size": os.getenv("SQLITE_CACHE_SIZE", "-65536"),  # negative = KiB (64 MiB)
+    "mmap_size": os.getenv("SQLITE_MMAP_SIZE", "268435456"),  # 256 MiB
+    "busy_timeout": os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"),
+}
+
+IS_SQLITE = DATABASE_URL.startswith("sqlite")
+IS_SQLITE_MEMORY = IS_SQLITE and (DATABASE_URL in ("sqlite://", "sqlite:///:memory:") or "mode=memory" in DATABASE_URL)
+
 # Special connection args for SQLite to allow usage across threads (needed for FastAPI)
 connect_args = {}
-if DATABASE_URL.startswith("sqlite"):
+if IS_SQLITE:
     connect_args = {"check_same_thread": False}
 
+# In-memory SQLite uses a single shared connection, so pool sizing does not apply
+pool_args = {} if IS_SQLITE_MEMORY else {"pool_size": POOL_SIZE, "max_overflow": MAX_OVERFLOW}
+
+
+# Set configured PRAGMAs on a fresh DB-API connection (works for sqlite3 and aiosqlite adapters)
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    try:
+        for name, value in SQLITE_PRAGMAS.items():
+            if value != "":
+                cursor.execute(f"PRAGMA {name}={value}")
+    finally:
+        cursor.close()
+
+
+def _create_engine(url: str):
+    eng = create_engine(url, echo=False, future=True, connect_args=connect_args, **pool_args)
+    if IS_SQLITE:
+        event.listen(eng, "connect", _apply_sqlite_pragmas)
+    instrument_engine(eng)
+    return eng
+
+
 # Create SQLAlchemy engine (shared by app and scripts)
-engine = create_engine(DATABASE_URL, echo=False, future=True, connect_args=connect_args)
+engine = _create_engine(DATABASE_URL)
 
 # Session factory for DB operations (one session per request/task)
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False, future=True)
 
+# Engine and session factory per shard (empty unless SHARDED; see app.shards)
+shard_engines = [_create_engine(SHARD_URL_TEMPLATE.format(shard=i)) for i in range(SHARD_COUNT)] if SHARDED else []
+ShardSessionLocal = [
+    sessionmaker(bind=eng, autoflush=False, autocommit=False, future=True, info={"shard": i})
+    for i, eng in enumerate(shard_engines)
+]
+
 # Base class for ORM models to inherit from
 Base = declarative_base()
+
+# Lazily created async engine/session factory (optional dependency, only built when first needed)
+_async_sessionmaker = None
+
+
+def get_async_sessionmaker():
+    global _async_sessionmaker
+    if _async_sessionmaker is None:
+        from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+
+        async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False, **pool_args)
+        if IS_SQLITE:
+            event.listen(async_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+        instrument_engine(async_engine.sync_engine)
+        _async_sessionmaker = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+    return _async_sessionmaker
@@ -1,5 +1,5 @@
-from typing import Generator
-from app.database import SessionLocal
+from typing import AsyncGenerator, Generator
+from app.database import SessionLocal, get_async_sessionmaker
 
 # Dependency that provides a DB session for a single request/operation
 # Ensures the session is closed after use
@@ -9,3 +9,8 @@ def get_db() -> Generator:
         yield db
     finally:
         db.close()
+
+# Async counterpart of get_db for async endpoints (DB_ASYNC=1)
+async def get_async_db() -> AsyncGenerator:
+    async with get_async_sessionmaker()() as db:
+        yield db
@@ -1,17 +1,35 @@
-from fastapi import FastAPI
-from app.database import Base, engine
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Response
+from app.metrics import METRICS_ENABLED, MetricsMiddleware, registry, CONTENT_TYPE
+from app.shards import create_schema
 from app.api.routers import weather, weather_stats
+from app import warmup
+
+
+# Startup: create missing tables (skipped when the schema is complete; `python -m scripts.init_db` does the same
+# ahead of deployment), then warm up in the background so the server accepts connections right away
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    create_schema()
+    task = None
+    if warmup.WARMUP_ENABLED:
+        task = asyncio.create_task(warmup.run())
+    else:
+        warmup.state.set("ready")
+    yield
+    if task is not None:
+        task.cancel()
+
 
 # Initialize FastAPI app with metadata for docs
 app = FastAPI(
     title="Corteva Weather API",
     version="1.0.0",
     description="Ingests daily weather records and exposes raw data & yearly stats.",
+    lifespan=lifespan,
 )
 
-# Auto-create all database tables at startup (simple setup, no migrations)
-Base.metadata.create_all(bind=engine)
-
 # Register API route groups
 app.include_router(weather.router)
 app.include_router(weather_stats.router)
@@ -21,4 +39,19 @@ app.include_router(weather_stats.router)
 def health():
     return {"status": "ok"}
 
+# Readiness: 200 once warm-up has finished, 503 while it runs (or if it failed), with its progress
+@app.get("/ready")
+def ready(response: Response):
+    if not warmup.state.ready:
+        response.status_code = 503
+    return warmup.state.info()
+
+# Request/SQL timing and a Prometheus scrape endpoint (METRICS_ENABLED=0 disables both)
+if METRICS_ENABLED:
+    app.add_middleware(MetricsMiddleware)
+
+    @app.get("/metrics", include_in_schema=False)
+    def metrics():
+        return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
 # Swagger UI available at /docs, OpenAPI JSON at /openapi.json
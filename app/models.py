@@ -1,8 +1,26 @@
+from datetime import date, timedelta
 from sqlalchemy import (
-    Column, Integer, String, Date, ForeignKey, UniqueConstraint, Index, Float
+    Column, Integer, String, Date, ForeignKey, UniqueConstraint, Index, Float, LargeBinary, cast, func, inspect,
+    type_coerce,
 )
 from sqlalchemy.orm import relationship, Mapped, mapped_column
-from app.database import Base
+from sqlalchemy.types import TypeDecorator
+from app.database import Base, RECORDS_LAYOUT
+
+EPOCH = date(1970, 1, 1)
+JULIAN_DAY_EPOCH = 2440587.5  # julianday('1970-01-01')
+
+
+# datetime.date stored as an INTEGER day number (days since 1970-01-01)
+class DayNumber(TypeDecorator):
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return (value - EPOCH).days if isinstance(value, date) else value
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else EPOCH + timedelta(days=value)
 
 # Master table for weather stations (unique station code)
 class Station(Base):
@@ -18,9 +36,14 @@ class Station(Base):
 # Daily raw weather measurements per station
 class WeatherRecord(Base):
     __tablename__ = "weather_records"
-    id: Mapped[int] = mapped_column(Integer, primary_key=True)
-    station_id: Mapped[int] = mapped_column(ForeignKey("stations.id", ondelete="CASCADE"), nullable=False, index=True)
-    date: Mapped[Date] = mapped_column(Date, nullable=False, index=True)
+    if RECORDS_LAYOUT == "compact":
+        # The (station_id, date) primary key is the table's own B-tree: no rowid, no surrogate id
+        station_id: Mapped[int] = mapped_column(ForeignKey("stations.id", ondelete="CASCADE"), primary_key=True)
+        date: Mapped[Date] = mapped_column(DayNumber, primary_key=True)
+    else:
+        id: Mapped[int] = mapped_column(Integer, primary_key=True)
+        station_id: Mapped[int] = mapped_column(ForeignKey("stations.id", ondelete="CASCADE"), nullable=False, index=True)
+        date: Mapped[Date] = mapped_column(Date, nullable=False, index=True)
 
     # Original units stored in tenths (e.g., -9999 as missing)
     tmax_tenths_c: Mapped[int | None] = mapped_column(Integer, nullable=True)
@@ -29,11 +52,55 @@ class WeatherRecord(Base):
 
     station = relationship("Station", back_populates="records")
 
-    # Enforce one record per station/date + index for fast lookups
-    __table_args__ = (
-        UniqueConstraint("station_id", "date", name="uq_station_date"),
-        Index("ix_records_station_date", "station_id", "date"),
-    )
+    if RECORDS_LAYOUT == "compact":
+        # Only a (date, station_id) index for the API sort order besides the clustered key
+        __table_args__ = (
+            Index("ix_records_date_station", "date", "station_id"),
+            {"sqlite_with_rowid": False},
+        )
+    else:
+        # Enforce one record per station/date + index for fast lookups;
+        # ix_records_date_station_id matches the API sort order for keyset pagination
+        __table_args__ = (
+            UniqueConstraint("station_id", "date", name="uq_station_date"),
+            Index("ix_records_station_date", "station_id", "date"),
+            Index("ix_records_date_station_id", "date", "station_id", "id"),
+        )
+
+
+# SQL strftime() over WeatherRecord.date, and the stored form of a 'YYYY-MM-DD' SQL expression
+# (range bounds computed in SQL), so period grouping and date bounds work with either layout
+if RECORDS_LAYOUT == "compact":
+    def record_strftime(fmt: str):
+        return func.strftime(fmt, type_coerce(WeatherRecord.date, Integer) * 86400, "unixepoch")
+
+    def record_date_from_text(expr):
+        return cast(func.julianday(expr) - JULIAN_DAY_EPOCH, Integer)
+else:
+    def record_strftime(fmt: str):
+        return func.strftime(fmt, WeatherRecord.date)
+
+    def record_date_from_text(expr):
+        return expr
+
+
+# Layout of an existing weather_records table ("standard", "compact", or None if it does not exist yet)
+def detect_records_layout(bind) -> str | None:
+    insp = inspect(bind)
+    if not insp.has_table(WeatherRecord.__tablename__):
+        return None
+    columns = {c["name"] for c in insp.get_columns(WeatherRecord.__tablename__)}
+    return "standard" if "id" in columns else "compact"
+
+
+# Refuse to run against a weather_records table in the other layout (queries would silently mismatch)
+def check_records_layout(bind):
+    found = detect_records_layout(bind)
+    if found is not None and found != RECORDS_LAYOUT:
+        raise RuntimeError(
+            f"weather_records uses the {found} layout but RECORDS_LAYOUT={RECORDS_LAYOUT}; "
+            "run `python -m scripts.migrate_schema` with the desired RECORDS_LAYOUT first"
+        )
 
 
 # Yearly aggregated stats per station
@@ -60,3 +127,73 @@ class WeatherStat(Base):
         UniqueConstraint("station_id", "year", name="uq_station_year"),
         Index("ix_stats_station_year", "station_id", "year"),
     )
+
+
+# Aggregate columns shared by the monthly and decade rollups (same semantics as WeatherStat)
+class StatAggregatesMixin:
+    avg_tmax_c: Mapped[float | None] = mapped_column(Float, nullable=True)
+    avg_tmin_c: Mapped[float | None] = mapped_column(Float, nullable=True)
+    total_prcp_cm: Mapped[float | None] = mapped_column(Float, nullable=True)
+    count_tmax: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    count_tmin: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+    count_prcp: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
+
+
+# Monthly aggregated stats per station
+class WeatherStatMonthly(StatAggregatesMixin, Base):
+    __tablename__ = "weather_stats_monthly"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    station_id: Mapped[int] = mapped_column(ForeignKey("stations.id", ondelete="CASCADE"), nullable=False)
+    year: Mapped[int] = mapped_column(Integer, nullable=False)
+    month: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    # One row per station/year/month; the unique index also serves station and station+year lookups
+    __table_args__ = (
+        UniqueConstraint("station_id", "year", "month", name="uq_station_year_month"),
+    )
+
+
+# Decade aggregated stats per station (decade = first year, e.g. 1990 for 1990-1999)
+class WeatherStatDecade(StatAggregatesMixin, Base):
+    __tablename__ = "weather_stats_decade"
+    id: Mapped[int] = mapped_column(Integer, primary_key=True)
+    station_id: Mapped[int] = mapped_column(ForeignKey("stations.id", ondelete="CASCADE"), nullable=False)
+    decade: Mapped[int] = mapped_column(Integer, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint("station_id", "decade", name="uq_station_decade"),
+    )
+
+
+# Per station-year value distribution of one measurement (see app.sketches), maintained during ingest
+class WeatherSketch(Base):
+    __tablename__ = "weather_sketches"
+    station_id: Mapped[int] = mapped_column(ForeignKey("stations.id", ondelete="CASCADE"), primary_key=True)
+    year: Mapped[int] = mapped_column(Integer, primary_key=True)
+    metric: Mapped[str] = mapped_column(String(8), primary_key=True)  # tmax | tmin | prcp
+    count: Mapped[int] = mapped_column(Integer, nullable=False)  # non-missing values summarized
+    data: Mapped[bytes] = mapped_column(LargeBinary, nullable=False)  # packed (value, count) int32 pairs
+
+
+# Station-years that received newly ingested records since stats were last computed
+class StatsDirty(Base):
+    __tablename__ = "stats_dirty"
+    station_id: Mapped[int] = mapped_column(ForeignKey("stations.id", ondelete="CASCADE"), primary_key=True)
+    year: Mapped[int] = mapped_column(Integer, primary_key=True)
+
+
+# Ingest state per source file so unchanged files are skipped and appended tails read incrementally
+class IngestManifest(Base):
+    __tablename__ = "ingest_manifest"
+    file_name: Mapped[str] = mapped_column(String(255), primary_key=True)
+    size: Mapped[int] = mapped_column(Integer, nullable=False)
+    mtime_ns: Mapped[int] = mapped_column(Integer, nullable=False)
+    sha256: Mapped[str] = mapped_column(String(64), nullable=False)  # hash of the first `size` bytes
+    offset: Mapped[int] = mapped_column(Integer, nullable=False)  # byte offset after the last complete line
+
+
+# Small key/value table for process-wide counters (e.g. the stats generation used for cache invalidation)
+class AppMeta(Base):
+    __tablename__ = "app_meta"
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    value: Mapped[int] = mapped_column(Integer, nullable=False, default=0)
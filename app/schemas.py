@@ -16,6 +16,30 @@ class WeatherRecordOut(BaseModel):
     tmin_c: float | None = Field(None, description="Min temperature in °C")
     prcp_mm: float | None = Field(None, description="Precipitation in mm")
 
+# One selector of a batch request: a station and an optional date range
+class BatchSelector(BaseModel):
+    station: str = Field(..., description="Station code")
+    start_date: date | None = None
+    end_date: date | None = None
+    limit: int = Field(1000, ge=1, le=10000, description="Max records for this selector")
+
+# Body of POST /api/weather/batch
+class BatchRequest(BaseModel):
+    selectors: list[BatchSelector] = Field(..., min_length=1, max_length=100)
+
+# Records of one selector, in date order
+class BatchResultOut(BaseModel):
+    station: str
+    start_date: date | None
+    end_date: date | None
+    records: list[WeatherRecordOut]
+    next_start_date: date | None = Field(None, description="Set when truncated by limit: start_date for the rest")
+
+# Response of POST /api/weather/batch: one result per selector, in request order
+class BatchResponse(BaseModel):
+    results: list[BatchResultOut]
+    unknown_stations: list[str] = Field(default_factory=list, description="Selector codes with no station")
+
 # Output schema for yearly aggregated statistics per station
 class WeatherStatOut(BaseModel):
     station: str
@@ -26,3 +50,55 @@ class WeatherStatOut(BaseModel):
     count_tmax: int
     count_tmin: int
     count_prcp: int
+
+# Yearly statistics plus requested percentiles from the station-year sketches:
+# {"tmax_c": {"95": 31.7}, "tmin_c": {...}, "prcp_mm": {...}} (None where a year has no values)
+class WeatherStatPercentilesOut(WeatherStatOut):
+    percentiles: dict[str, dict[str, float | None]]
+
+# Output schema for monthly aggregated statistics per station
+class WeatherStatMonthOut(BaseModel):
+    station: str
+    year: int
+    month: int
+    avg_tmax_c: float | None
+    avg_tmin_c: float | None
+    total_prcp_cm: float | None
+    count_tmax: int
+    count_tmin: int
+    count_prcp: int
+
+# Output schema for decade aggregated statistics per station (decade = first year, e.g. 1990)
+class WeatherStatDecadeOut(BaseModel):
+    station: str
+    decade: int
+    avg_tmax_c: float | None
+    avg_tmin_c: float | None
+    total_prcp_cm: float | None
+    count_tmax: int
+    count_tmin: int
+    count_prcp: int
+
+# One ranked station in a cross-station summary
+class StationValueOut(BaseModel):
+    rank: int
+    station: str
+    value: float
+
+# Cross-station aggregate of one metric for one year
+class YearSummaryOut(BaseModel):
+    year: int
+    metric: str
+    stations: int = Field(..., description="Stations with a value for this year")
+    mean: float | None
+    min: float | None
+    max: float | None
+    top: list[StationValueOut]
+
+# Hit/miss counters and size of the stats response cache
+class CacheInfoOut(BaseModel):
+    hits: int
+    misses: int
+    size: int
+    maxsize: int
+    generation: int | None
@@ -0,0 +1,103 @@
+import contextvars
+import heapq
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from typing import Callable, Iterable, TypeVar
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import Session
+
+from app.database import (
+    Base, engine, SHARD_COUNT, SHARDED, shard_engines, ShardSessionLocal,
+)
+from app.models import Station, AppMeta, IngestManifest, check_records_layout
+
+T = TypeVar("T")
+
+# Tables kept in the catalog DB when sharded; every other table lives in the shards. Shards also get a
+# stations table mirroring their own stations (same ids), so per-shard statements can join on Station.code.
+CATALOG_TABLES = [Station.__table__, AppMeta.__table__, IngestManifest.__table__]
+
+
+# Shard index of a station code: stable hash (not Python's per-process hash), so every process agrees
+def shard_for(code: str) -> int:
+    return zlib.crc32(code.encode("utf-8")) % SHARD_COUNT
+
+
+# Session on the shard holding a station's records
+def shard_session(code: str) -> Session:
+    return ShardSessionLocal[shard_for(code)]()
+
+
+# Create the tables missing from one DB, and the indexes missing from its existing tables (databases created
+# before an index was added to the models). Cheap when everything exists: the table list plus one index list
+# per table. Returns the names of the tables and indexes created.
+def _create_missing(bind, tables: list) -> list[str]:
+    insp = inspect(bind)
+    existing = set(insp.get_table_names())
+    missing = [t for t in tables if t.name not in existing]
+    if missing:
+        Base.metadata.create_all(bind=bind, tables=missing)
+    created = [t.name for t in missing]
+    for t in tables:
+        if t.name not in existing:
+            continue
+        indexed = {ix["name"] for ix in insp.get_indexes(t.name)}
+        for ix in sorted(t.indexes, key=lambda ix: ix.name):
+            if ix.name not in indexed:
+                ix.create(bind)
+                created.append(ix.name)
+    return created
+
+
+# Check the records layout and create missing tables and indexes: catalog + every shard, or the single DB.
+# Returns the names of the tables and indexes created (empty when the schema was already complete).
+def create_schema() -> list[str]:
+    tables = Base.metadata.sorted_tables
+    if not SHARDED:
+        check_records_layout(engine)
+        return _create_missing(engine, tables)
+    created = _create_missing(engine, CATALOG_TABLES)
+    for eng in shard_engines:
+        check_records_layout(eng)
+        created += _create_missing(eng, tables)
+    return created
+
+
+_pool: ThreadPoolExecutor | None = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=SHARD_COUNT, thread_name_prefix="shard")
+    return _pool
+
+
+def _with_session(shard: int, fn: Callable[[Session], T]) -> T:
+    with ShardSessionLocal[shard]() as db:
+        return fn(db)
+
+
+# Run fn(session) on the given shards (default: all) concurrently; results in shard order.
+# Each call runs in a copy of the caller's context, so SQL metrics are attributed to the request.
+def fan_out(fn: Callable[[Session], T], shards: Iterable[int] | None = None) -> list[T]:
+    shards = list(range(SHARD_COUNT) if shards is None else shards)
+    if len(shards) == 1:
+        return [_with_session(shards[0], fn)]
+    futures = [
+        _executor().submit(contextvars.copy_context().run, _with_session, shard, fn) for shard in shards
+    ]
+    return [f.result() for f in futures]
+
+
+# Rows of a statement that each shard returns sorted by key, merged into one sorted page.
+# stmt must already be limited to offset + limit rows (each shard could hold the whole page).
+def fan_out_sorted(stmt, key: Callable, limit: int, offset: int = 0) -> list:
+    results = fan_out(lambda db: db.execute(stmt).all())
+    return list(islice(heapq.merge(*results, key=key), offset, offset + limit))
@@ -0,0 +1,126 @@
+from datetime import date
+
+import numpy as np
+from sqlalchemy import Integer, cast, delete, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from app.models import WeatherRecord, WeatherSketch, record_strftime
+
+# Sketched measurements: metric name -> weather_records column
+METRIC_COLUMNS = {
+    "tmax": "tmax_tenths_c",
+    "tmin": "tmin_tenths_c",
+    "prcp": "prcp_tenths_mm",
+}
+
+
+# Mergeable value distribution of integer (tenths) measurements: sorted distinct values with their counts.
+# Source data has a resolution of one tenth, so this is lossless: nearest-rank percentiles are exact
+# (error bound 0), merging is count addition, and size is bounded by the distinct values (<= 366 per year).
+class ValueSketch:
+    def __init__(self, values: np.ndarray | None = None, counts: np.ndarray | None = None):
+        self.values = np.empty(0, dtype=np.int32) if values is None else values
+        self.counts = np.empty(0, dtype=np.int64) if counts is None else counts
+
+    @classmethod
+    def of(cls, observations) -> "ValueSketch":
+        values, counts = np.unique(np.asarray(observations, dtype=np.int32), return_counts=True)
+        return cls(values.astype(np.int32), counts.astype(np.int64))
+
+    @property
+    def total(self) -> int:
+        return int(self.counts.sum())
+
+    def merge(self, other: "ValueSketch") -> "ValueSketch":
+        values, inverse = np.unique(np.concatenate([self.values, other.values]), return_inverse=True)
+        counts = np.bincount(inverse, weights=np.concatenate([self.counts, other.counts]), minlength=len(values))
+        return ValueSketch(values.astype(np.int32), counts.astype(np.int64))
+
+    # Nearest-rank percentiles (numpy method="inverted_cdf"): the smallest value whose cumulative count
+    # reaches p% of the total; None when the sketch is empty
+    def percentiles(self, ps: list[float]) -> list[int | None]:
+        cumulative = np.cumsum(self.counts, dtype=np.int64)
+        total = int(cumulative[-1]) if len(cumulative) else 0
+        if total == 0:
+            return [None] * len(ps)
+        ranks = np.maximum(np.ceil(np.asarray(ps, dtype=float) / 100 * total), 1)
+        return self.values[np.searchsorted(cumulative, ranks, "left")].tolist()
+
+    def to_bytes(self) -> bytes:
+        return np.stack([self.values, self.counts.astype(np.int32)], axis=1).astype("<i4").tobytes()
+
+    @classmethod
+    def from_bytes(cls, data: bytes) -> "ValueSketch":
+        # Read-only views into the buffer; merge() builds new arrays rather than mutating these
+        pairs = np.frombuffer(data, dtype="<i4").reshape(-1, 2)
+        return cls(pairs[:, 0], pairs[:, 1])
+
+
+# Non-missing tenths values of a batch of record row dicts, per sketched metric
+def batch_observations(rows: list[dict]) -> dict[str, list[int]]:
+    return {
+        metric: [v for v in (row[col] for row in rows) if v is not None]
+        for metric, col in METRIC_COLUMNS.items()
+    }
+
+
+# Add newly inserted observations of one station-year to its persisted sketches (read-merge-upsert)
+def merge_sketches(db: Session, station_id: int, year: int, obs: dict[str, list[int]]):
+    existing = {
+        metric: ValueSketch.from_bytes(data)
+        for metric, data in db.execute(
+            select(WeatherSketch.metric, WeatherSketch.data)
+            .where(WeatherSketch.station_id == station_id, WeatherSketch.year == year)
+        ).all()
+    }
+    sketches = {}
+    for metric, values in obs.items():
+        sketch = ValueSketch.of(values)
+        if metric in existing:
+            sketch = existing[metric].merge(sketch)
+        sketches[metric] = sketch
+    _upsert(db, station_id, year, sketches)
+
+
+# Recompute one station-year's sketches from weather_records (used when only part of a batch was new,
+# so the inserted rows are not known individually)
+def rebuild_sketches(db: Session, station_id: int, year: int):
+    cols = [getattr(WeatherRecord, c) for c in METRIC_COLUMNS.values()]
+    rows = db.execute(
+        select(*cols).where(
+            WeatherRecord.station_id == station_id,
+            WeatherRecord.date >= date(year, 1, 1),
+            WeatherRecord.date < date(year + 1, 1, 1),
+        )
+    ).all()
+    db.execute(delete(WeatherSketch).where(WeatherSketch.station_id == station_id, WeatherSketch.year == year))
+    _upsert(db, station_id, year, {
+        metric: ValueSketch.of([r[i] for r in rows if r[i] is not None])
+        for i, metric in enumerate(METRIC_COLUMNS)
+    })
+
+
+def _upsert(db: Session, station_id: int, year: int, sketches: dict[str, ValueSketch]):
+    rows = [
+        {"station_id": station_id, "year": year, "metric": m, "count": s.total, "data": s.to_bytes()}
+        for m, s in sketches.items()
+    ]
+    stmt = sqlite_insert(WeatherSketch.__table__)
+    db.execute(
+        stmt.on_conflict_do_update(
+            index_elements=["station_id", "year", "metric"],
+            set_={"count": stmt.excluded["count"], "data": stmt.excluded["data"]},
+        ),
+        rows,
+    )
+
+
+# Rebuild every station-year's sketches from weather_records (for DBs ingested before sketches existed)
+def rebuild_all_sketches(db: Session) -> int:
+    year = cast(record_strftime("%Y"), Integer)
+    pairs = db.execute(select(WeatherRecord.station_id, year).distinct().order_by(WeatherRecord.station_id, year)).all()
+    for station_id, y in pairs:
+        rebuild_sketches(db, station_id, y)
+    db.commit()
+    return len(pairs)
@@ -0,0 +1,174 @@
+import json
+import os
+import shutil
+import threading
+from datetime import date
+
+import numpy as np
+from sqlalchemy import select, func
+from sqlalchemy.orm import Session
+
+from app.models import Station, WeatherRecord, EPOCH
+
+# Directory of the memory-mapped records snapshot served by /api/weather (unset = always use the DB)
+SNAPSHOT_DIR = os.getenv("WEATHER_SNAPSHOT_DIR")
+
+MISSING_TMAX, MISSING_TMIN, MISSING_PRCP = 1, 2, 4  # bits in missing.npy
+
+# Column files: one .npy per column, rows grouped by station and sorted by date within a station
+COLUMNS = {
+    "days": np.int32,     # days since 1970-01-01
+    "tmax": np.int32,     # tenths of °C, 0 where missing
+    "tmin": np.int32,     # tenths of °C, 0 where missing
+    "prcp": np.int32,     # tenths of mm, 0 where missing
+    "missing": np.uint8,  # MISSING_* bitmask
+}
+INDEX_FILE = "stations.json"  # {code: [station_id, start_row, stop_row]}; written last
+
+
+# Export weather_records into a columnar snapshot directory; returns the number of rows written.
+# Built in a sibling temp dir and swapped in by rename, so readers never see a half-written snapshot.
+# db may also be a list of shard sessions: a station's rows all live in one shard, so stay grouped.
+def build_snapshot(db: Session | list[Session], out_dir: str, chunk_size: int = 50_000) -> int:
+    sessions = db if isinstance(db, list) else [db]
+    out_dir = os.path.abspath(out_dir)
+    tmp_dir = f"{out_dir}.tmp-{os.getpid()}"
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+
+    # Size the arrays and stream the rows from the same read snapshot: pysqlite doesn't wrap SELECTs in a
+    # transaction, so without BEGIN a concurrent ingest could land between the COUNT and the stream
+    for s in sessions:
+        conn = s.connection()
+        if not conn.connection.dbapi_connection.in_transaction:
+            conn.exec_driver_sql("BEGIN")
+    total = sum(s.execute(select(func.count()).select_from(WeatherRecord)).scalar_one() for s in sessions)
+    arrays = {
+        name: np.lib.format.open_memmap(os.path.join(tmp_dir, f"{name}.npy"), mode="w+", dtype=dtype, shape=(total,))
+        for name, dtype in COLUMNS.items()
+    }
+    stmt = (
+        select(
+            Station.code, WeatherRecord.station_id, WeatherRecord.date,
+            WeatherRecord.tmax_tenths_c, WeatherRecord.tmin_tenths_c, WeatherRecord.prcp_tenths_mm,
+        )
+        .join(Station, Station.id == WeatherRecord.station_id)
+        .order_by(WeatherRecord.station_id, WeatherRecord.date)
+        .execution_options(yield_per=chunk_size)
+    )
+
+    index = {}
+    pos = 0
+    for chunk in (c for s in sessions for c in s.execute(stmt).partitions()):
+        n = len(chunk)
+        codes, sids, dates, tmax, tmin, prcp = zip(*chunk)
+        sl = slice(pos, pos + n)
+        arrays["days"][sl] = np.array(dates, dtype="datetime64[D]").astype(np.int64)
+        missing = np.zeros(n, dtype=np.uint8)
+        for name, values, bit in (("tmax", tmax, MISSING_TMAX), ("tmin", tmin, MISSING_TMIN), ("prcp", prcp, MISSING_PRCP)):
+            col = np.array(values, dtype=object)
+            absent = col == None  # noqa: E711 - elementwise None test
+            col[absent] = 0
+            arrays[name][sl] = col.astype(np.int32)
+            missing[absent] |= bit
+        arrays["missing"][sl] = missing
+        for i, (code, sid) in enumerate(zip(codes, sids)):
+            entry = index.get(code)
+            if entry is None:
+                index[code] = [sid, pos + i, pos + i + 1]
+            else:
+                entry[2] = pos + i + 1
+        pos += n
+
+    for arr in arrays.values():
+        arr.flush()
+    del arrays
+    with open(os.path.join(tmp_dir, INDEX_FILE), "w", encoding="utf-8") as f:
+        json.dump(index, f)
+
+    # Swap directories; processes still mapping the old files keep valid pages until they reload
+    old_dir = f"{out_dir}.old-{os.getpid()}"
+    if os.path.exists(out_dir):
+        os.rename(out_dir, old_dir)
+    os.rename(tmp_dir, out_dir)
+    shutil.rmtree(old_dir, ignore_errors=True)
+    return pos
+
+
+# Read-only view over a snapshot directory; columns are np.memmap so worker processes share OS pages
+class Snapshot:
+    def __init__(self, path: str):
+        self.path = path
+        self.version = os.stat(os.path.join(path, INDEX_FILE)).st_mtime_ns
+        with open(os.path.join(path, INDEX_FILE), encoding="utf-8") as f:
+            self.stations = json.load(f)
+        cols = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in COLUMNS}
+        self.days = cols["days"]
+        self.tmax, self.tmin, self.prcp, self.missing = cols["tmax"], cols["tmin"], cols["prcp"], cols["missing"]
+
+    # Rows for one station as (code, date, tmax_c, tmin_c, prcp_mm, station_id) in API sort order and units,
+    # or None if the station is not in the snapshot. `after` is a decoded (date, station_id) cursor.
+    def query(
+        self,
+        station: str,
+        on_date: date | None,
+        start_date: date | None,
+        end_date: date | None,
+        after: tuple[date, int] | None,
+        limit: int,
+        offset: int = 0,
+    ) -> list[tuple] | None:
+        entry = self.stations.get(station)
+        if entry is None:
+            return None
+        sid, lo, hi = entry
+        days = self.days[lo:hi]
+
+        # Binary search the date range within this station's block
+        if on_date:
+            start_date = end_date = on_date
+        a = 0 if start_date is None else int(np.searchsorted(days, (start_date - EPOCH).days, "left"))
+        b = len(days) if end_date is None else int(np.searchsorted(days, (end_date - EPOCH).days, "right"))
+        if after is not None:
+            c_date, c_sid = after
+            c_day = (c_date - EPOCH).days
+            k = int(np.searchsorted(days, c_day, "left"))
+            # Same (date, station_id) ordering as SQL: a row on the cursor date follows it only for a later station
+            if k < len(days) and days[k] == c_day and sid <= c_sid:
+                k += 1
+            a = max(a, k)
+        a += offset
+        b = min(b, a + limit)
+        if a >= b:
+            return []
+
+        sl = slice(lo + a, lo + b)
+        missing = self.missing[sl]
+        dates = (self.days[sl].astype("datetime64[D]")).tolist()
+        # Tenths -> °C / mm for the whole slice at once
+        tmax = np.where(missing & MISSING_TMAX, None, self.tmax[sl] / 10.0).tolist()
+        tmin = np.where(missing & MISSING_TMIN, None, self.tmin[sl] / 10.0).tolist()
+        prcp = np.where(missing & MISSING_PRCP, None, self.prcp[sl] / 10.0).tolist()
+        return [(station, d, x, n, p, sid) for d, x, n, p in zip(dates, tmax, tmin, prcp)]
+
+
+_loaded: Snapshot | None = None
+_lock = threading.Lock()
+
+
+# Current snapshot for SNAPSHOT_DIR (reloaded when a rebuild replaces it), or None if disabled/absent
+def get_snapshot() -> Snapshot | None:
+    global _loaded
+    if not SNAPSHOT_DIR:
+        return None
+    try:
+        version = os.stat(os.path.join(SNAPSHOT_DIR, INDEX_FILE)).st_mtime_ns
+    except OSError:
+        return None
+    snap = _loaded
+    if snap is None or snap.path != SNAPSHOT_DIR or snap.version != version:
+        with _lock:
+            snap = _loaded
+            if snap is None or snap.path != SNAPSHOT_DIR or snap.version != version:
+                snap = _loaded = Snapshot(SNAPSHOT_DIR)
+    return snap
@@ -0,0 +1,35 @@
+import threading
+
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.models import Station
+
+
+# In-memory station code -> id map, loaded during warm-up (app.warmup). Routers add a station_id filter
+# next to the Station.code one when a code is known, so the planner goes straight to the records index;
+# stations added after warm-up are still served (just without the shortcut), and an entry gone stale
+# (station recreated under a new id) yields no rows rather than another station's.
+class StationIndex:
+    def __init__(self):
+        self._ids: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def load(self, db: Session) -> int:
+        ids = dict(db.execute(select(Station.code, Station.id)).all())
+        with self._lock:
+            self._ids = ids
+        return len(ids)
+
+    def get(self, code: str) -> int | None:
+        return self._ids.get(code)
+
+    def codes(self) -> list[str]:
+        return list(self._ids)
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+# Process-wide index used by the routers (catalog ids when sharded)
+station_index = StationIndex()
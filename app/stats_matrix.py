@@ -0,0 +1,102 @@
+import threading
+import warnings
+
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+from app.cache import get_stats_generation
+from app.database import SHARDED
+from app.models import Station, WeatherStat
+from app.shards import fan_out
+
+# weather_stats columns held as station × year matrices
+METRICS = ("avg_tmax_c", "avg_tmin_c", "total_prcp_cm")
+
+
+# Yearly stats of all stations as dense float matrices (NaN = no value), rows sorted by station code
+class StatsMatrix:
+    def __init__(self, codes: list[str], years: np.ndarray, values: dict[str, np.ndarray], generation: int):
+        self.codes = codes
+        self.years = years
+        self.values = values
+        self.generation = generation
+
+    # Cross-station summary per year for one metric: count/mean/min/max plus the top-N stations.
+    # Everything is computed column-wise over the whole matrix, no per-station Python loops.
+    def summarize(self, metric: str, years: list[int] | None, top: int, descending: bool) -> list[dict]:
+        # No stats computed yet: (0, 0) matrices can't be reduced
+        if not self.codes or len(self.years) == 0:
+            return []
+        cols = np.arange(len(self.years)) if years is None else np.searchsorted(self.years, years)
+        if years is not None:
+            found = (cols < len(self.years)) & (self.years[np.minimum(cols, len(self.years) - 1)] == years)
+            cols = cols[found]
+        if cols.size == 0:
+            return []
+        m = self.values[metric][:, cols]
+        present = ~np.isnan(m)
+        counts = present.sum(axis=0)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", RuntimeWarning)  # all-NaN columns -> NaN
+            mean, lo, hi = np.nanmean(m, axis=0), np.nanmin(m, axis=0), np.nanmax(m, axis=0)
+
+        # Rank with NaN last; stable sort keeps ties in station-code order
+        key = np.where(present, -m if descending else m, np.inf)
+        order = np.argsort(key, axis=0, kind="stable")[:top]
+
+        out = []
+        for j, col in enumerate(cols):
+            ranked = [i for i in order[:, j].tolist() if present[i, j]]
+            out.append({
+                "year": int(self.years[col]),
+                "metric": metric,
+                "stations": int(counts[j]),
+                "mean": None if counts[j] == 0 else float(mean[j]),
+                "min": None if counts[j] == 0 else float(lo[j]),
+                "max": None if counts[j] == 0 else float(hi[j]),
+                "top": [
+                    {"rank": r + 1, "station": self.codes[i], "value": float(m[i, j])}
+                    for r, i in enumerate(ranked)
+                ],
+            })
+        return out
+
+
+# Build the matrices from weather_stats in one query (one per shard when sharded)
+def load_stats_matrix(db: Session, generation: int) -> StatsMatrix:
+    stmt = (
+        select(Station.code, WeatherStat.year, *(getattr(WeatherStat, m) for m in METRICS))
+        .join(Station, Station.id == WeatherStat.station_id)
+    )
+    if SHARDED:
+        rows = [row for part in fan_out(lambda s: s.execute(stmt).all()) for row in part]
+    else:
+        rows = db.execute(stmt).all()
+    codes = sorted({r[0] for r in rows})
+    years = np.array(sorted({r[1] for r in rows}), dtype=np.int64)
+    values = {m: np.full((len(codes), len(years)), np.nan) for m in METRICS}
+    if rows:
+        cols = list(zip(*rows))
+        ri = np.searchsorted(np.array(codes, dtype=object), np.array(cols[0], dtype=object))
+        ci = np.searchsorted(years, np.array(cols[1], dtype=np.int64))
+        for k, m in enumerate(METRICS):
+            values[m][ri, ci] = np.array(cols[2 + k], dtype=float)  # None -> NaN
+    return StatsMatrix(codes, years, values, generation)
+
+
+_matrix: StatsMatrix | None = None
+_lock = threading.Lock()
+
+
+# Cached matrix, reloaded when compute_stats has bumped the stats generation since it was built
+def get_stats_matrix(db: Session) -> StatsMatrix:
+    global _matrix
+    generation = get_stats_generation(db)
+    matrix = _matrix
+    if matrix is None or matrix.generation != generation:
+        with _lock:
+            matrix = _matrix
+            if matrix is None or matrix.generation != generation:
+                matrix = _matrix = load_stats_matrix(db, generation)
+    return matrix
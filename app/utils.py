@@ -1,3 +1,12 @@
+import base64
+import json
+from datetime import date
+
+try:
+    import orjson  # optional fast JSON encoder
+except ImportError:
+    orjson = None
+
 # Convert stored tenths of °C to standard °C (None if missing)
 def as_celsius(tenths: int | None) -> float | None:
     return None if tenths is None else tenths / 10.0
@@ -5,3 +14,31 @@ def as_celsius(tenths: int | None) -> float | None:
 # Convert stored tenths of millimeters to millimeters (None if missing)
 def as_mm(tenths_mm: int | None) -> float | None:
     return None if tenths_mm is None else tenths_mm / 10.0
+
+# Encode keyset pagination values (e.g. last date/station_id/id seen) as an opaque URL-safe token
+def encode_cursor(values: list) -> str:
+    raw = json.dumps(values, separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+# Decode a token produced by encode_cursor (ValueError if it is not one)
+def decode_cursor(token: str) -> list:
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        values = json.loads(raw)
+    except (ValueError, UnicodeDecodeError) as exc:
+        raise ValueError("malformed cursor") from exc
+    if not isinstance(values, list):
+        raise ValueError("malformed cursor")
+    return values
+
+# JSON for values the stdlib encoder does not know (dates as ISO strings, like Pydantic and orjson)
+def _json_default(value):
+    if isinstance(value, date):
+        return value.isoformat()
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+# Compact JSON bytes for API payloads built from plain dicts/lists; orjson when installed, stdlib json otherwise
+def dumps_json(obj) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, separators=(",", ":"), ensure_ascii=False, default=_json_default).encode()
@@ -0,0 +1,132 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from datetime import date
+
+from app.api.routers import weather, weather_stats
+from app.cache import STATS_GENERATION_QUERY
+from app.database import SessionLocal, engine, shard_engines, get_async_sessionmaker, SHARDED, USE_ASYNC_DB
+from app.shards import fan_out
+from app.snapshot import get_snapshot
+from app.stations import station_index
+from app.stats_matrix import get_stats_matrix
+
+# Warm the API process in the background after startup; /ready answers 503 until done (0 = ready at once)
+WARMUP_ENABLED = os.getenv("WARMUP", "1").lower() in ("1", "true", "yes")
+
+# Read up to this many MB of each SQLite file during warm-up, so the OS page cache (shared by every
+# connection's mmap) is filled before traffic arrives (0 disables)
+WARMUP_PREFETCH_MB = int(os.getenv("WARMUP_PREFETCH_MB", "256"))
+
+# Representative filter values for the warm-up statements (structure matters for the statement cache, not values)
+WARMUP_DAY = date(2000, 1, 1)
+
+log = logging.getLogger("app.warmup")
+
+
+# Progress of the warm-up, reported by GET /ready
+class WarmupState:
+    def __init__(self):
+        self.status = "pending"  # pending | running | ready | failed
+        self.details: dict = {}
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self) -> bool:
+        return self.status == "ready"
+
+    def set(self, status: str, **details):
+        with self._lock:
+            self.status = status
+            self.details.update(details)
+
+    def info(self) -> dict:
+        with self._lock:
+            return {"status": self.status, **self.details}
+
+
+state = WarmupState()
+
+
+# Sequentially read the head of a SQLite file into the OS page cache; returns bytes read
+def _prefetch(path: str, limit: int) -> int:
+    total = 0
+    buf = bytearray(1 << 20)
+    with open(path, "rb", buffering=0) as f:
+        while total < limit:
+            n = f.readinto(buf)
+            if not n:
+                break
+            total += n
+    return total
+
+
+def _database_files() -> list[str]:
+    paths = [eng.url.database for eng in (engine, *shard_engines) if eng.dialect.name == "sqlite"]
+    return [p for p in paths if p and p != ":memory:" and os.path.exists(p)]
+
+
+# Statements on the records/stats DB (each shard when sharded) and on the catalog
+def _statements() -> tuple[list, list]:
+    station = next(iter(station_index.codes()), None)
+    data = [
+        *weather.warmup_statements(station, WARMUP_DAY),
+        *weather_stats.warmup_statements(station, WARMUP_DAY.year),
+    ]
+    return data, [STATS_GENERATION_QUERY]
+
+
+def _warm_sync() -> dict:
+    t0 = time.perf_counter()
+    prefetched = 0
+    if WARMUP_PREFETCH_MB > 0:
+        for path in _database_files():
+            prefetched += _prefetch(path, WARMUP_PREFETCH_MB << 20)
+    t_prefetch = time.perf_counter() - t0
+
+    with SessionLocal() as db:
+        stations = station_index.load(db)
+        data, catalog = _statements()
+        for stmt in catalog:
+            db.execute(stmt).all()
+        if SHARDED:
+            fan_out(lambda s: [s.execute(stmt).all() for stmt in data])
+        else:
+            for stmt in data:
+                db.execute(stmt).all()
+        # In-memory structures otherwise built by the first request that needs them
+        get_stats_matrix(db)
+    get_snapshot()
+    return {
+        "stations": stations,
+        "statements": len(data) + len(catalog),
+        "prefetched_mb": round(prefetched / 2**20, 1),
+        "prefetch_seconds": round(t_prefetch, 3),
+    }
+
+
+# The async handlers run on their own engine, whose statement cache is separate from the sync one
+async def _warm_async():
+    data, catalog = _statements()
+    async with get_async_sessionmaker()() as db:
+        for stmt in (*catalog, *data):
+            (await db.execute(stmt)).all()
+
+
+# Background warm-up task started by the app lifespan: station index, page cache prefetch, statement cache,
+# stats matrix and snapshot. Failures are logged and reported by /ready; requests are served regardless.
+async def run():
+    t0 = time.perf_counter()
+    state.set("running")
+    try:
+        details = await asyncio.to_thread(_warm_sync)
+        if USE_ASYNC_DB:
+            await _warm_async()
+    except Exception as exc:
+        log.exception("Warm-up failed")
+        state.set("failed", error=repr(exc), seconds=round(time.perf_counter() - t0, 3))
+        return
+    state.set("ready", **details, seconds=round(time.perf_counter() - t0, 3))
+    log.info("Warm-up finished: %s", state.info())
@@ -0,0 +1,138 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+
+from scripts.gen_wx_data import generate, DEFAULT_START_YEAR
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Timed phases compared against a baseline (seconds, lower is better)
+TIMED_PHASES = ("ingest_cold_s", "ingest_rerun_s", "stats_bulk_s", "stats_incremental_s")
+
+
+# Run one pipeline script in a fresh interpreter against the benchmark DB; returns wall time in seconds.
+# Output is captured (not timed on a terminal) and stderr is reported if the step fails.
+def run_step(module: str, args: list[str], env: dict[str, str]) -> float:
+    t0 = time.perf_counter()
+    proc = subprocess.run([sys.executable, "-m", module, *args], cwd=ROOT, env=env, capture_output=True, text=True)
+    elapsed = time.perf_counter() - t0
+    if proc.returncode != 0:
+        raise RuntimeError(f"{module} {' '.join(args)} exited with {proc.returncode}:\n{proc.stderr.strip()}")
+    return elapsed
+
+
+# File size of a SQLite DB after folding the WAL back into it, plus its record count
+def db_facts(path: str) -> dict:
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        rows = conn.execute("SELECT count(*) FROM weather_records").fetchone()[0]
+    finally:
+        conn.close()
+    return {"db_bytes": os.path.getsize(path), "records": rows}
+
+
+# Generate (or reuse) data, then time cold ingest, an unchanged re-run, bulk stats and an incremental
+# stats pass after appending one day to every file, all on a throwaway SQLite DB
+def run_benchmark(work_dir: str, data_dir: str | None, gen: dict, env_extra: dict[str, str], ingest_args: list[str]) -> dict:
+    result = {"params": {**gen, "ingest_args": ingest_args, "env": env_extra}}
+    generated = data_dir is None
+    if generated:
+        data_dir = os.path.join(work_dir, "wx_data")
+        t0 = time.perf_counter()
+        result["generated"] = generate(data_dir, **gen)
+        result["generate_s"] = round(time.perf_counter() - t0, 3)
+    result["params"]["data_dir"] = data_dir
+
+    db_path = os.path.join(work_dir, "bench.db")
+    env = {**os.environ, **env_extra, "DATABASE_URL": f"sqlite:///{db_path}"}
+    env.pop("WEATHER_SNAPSHOT_DIR", None)
+    ingest = ["--data-dir", data_dir, *ingest_args]
+
+    result["ingest_cold_s"] = run_step("scripts.ingest_weather", ingest, env)
+    result.update(db_facts(db_path))
+    result["ingest_rows_per_s"] = round(result["records"] / result["ingest_cold_s"]) if result["ingest_cold_s"] else None
+    result["ingest_rerun_s"] = run_step("scripts.ingest_weather", ingest, env)
+    result["stats_bulk_s"] = run_step("scripts.compute_stats", ["--mode", "bulk"], env)
+
+    # Appending a day to each file exercises the manifest tail reads and the dirty-set stats path
+    if generated:
+        next_day = f"{gen['start_year'] + gen['years']}0101"
+        for name in os.listdir(data_dir):
+            with open(os.path.join(data_dir, name), "a", encoding="utf-8") as f:
+                f.write(f"{next_day}\t  100\t    0\t    5\n")
+        result["ingest_append_s"] = run_step("scripts.ingest_weather", ingest, env)
+        result["stats_incremental_s"] = run_step("scripts.compute_stats", ["--incremental"], env)
+
+    result["db_bytes_final"] = db_facts(db_path)["db_bytes"]
+    for key in list(result):
+        if key.endswith("_s") and result[key] is not None:
+            result[key] = round(result[key], 3)
+    return result
+
+
+# Phases slower than baseline * (1 + tolerance); missing phases are ignored
+def regressions(current: dict, baseline: dict, tolerance: float) -> dict:
+    out = {}
+    for phase in TIMED_PHASES:
+        old, new = baseline.get(phase), current.get(phase)
+        if old and new and new > old * (1 + tolerance):
+            out[phase] = {"baseline": old, "current": new, "ratio": round(new / old, 2)}
+    return out
+
+
+def main():
+    # CLI entry point: end-to-end pipeline benchmark with JSON output, fully offline
+    parser = argparse.ArgumentParser(description="Benchmark ingest and stats on synthetic wx_data with a temp SQLite DB.")
+    parser.add_argument("--stations", type=int, default=50, help="Synthetic station files (default: %(default)s)")
+    parser.add_argument("--years", type=int, default=10, help="Years per station (default: %(default)s)")
+    parser.add_argument("--start-year", type=int, default=DEFAULT_START_YEAR, help="First year (default: %(default)s)")
+    parser.add_argument("--missing-rate", type=float, default=0.02, help="Probability of a -9999 value (default: %(default)s)")
+    parser.add_argument("--malformed-rate", type=float, default=0.001, help="Probability of a malformed line (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="Benchmark an existing directory instead of generating one (not modified)")
+    parser.add_argument("--workers", type=int, default=1, help="Passed to ingest_weather (default: %(default)s)")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the scripts, e.g. RECORDS_LAYOUT=compact (repeatable)")
+    parser.add_argument("--output", help="Also write the JSON result to this file")
+    parser.add_argument("--baseline", help="Previous JSON result; exit 1 if a phase regressed beyond --tolerance")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown vs baseline (default: %(default)s)")
+    parser.add_argument("--keep", action="store_true", help="Keep the temp directory and print its path")
+    args = parser.parse_args()
+
+    env_extra = dict(kv.split("=", 1) for kv in args.env)
+    gen = {"stations": args.stations, "years": args.years, "start_year": args.start_year, "missing_rate": args.missing_rate,
+           "malformed_rate": args.malformed_rate, "seed": args.seed}
+    work_dir = tempfile.mkdtemp(prefix="wx-bench-")
+    try:
+        result = run_benchmark(work_dir, args.data_dir, gen, env_extra, ["--workers", str(args.workers)])
+    finally:
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+    result["platform"] = {"python": platform.python_version(), "sqlite": sqlite3.sqlite_version, "cpus": os.cpu_count()}
+    if args.keep:
+        result["work_dir"] = work_dir
+
+    failed = {}
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            failed = regressions(result, json.load(f), args.tolerance)
+        result["regressions"] = failed
+
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import argparse
+import json
+import statistics
+import time
+from datetime import date
+
+from pydantic import TypeAdapter
+from sqlalchemy import select
+
+from app.api.routers.weather import RecordQuery, _records_stmt, _records_page
+from app.api.routers.weather_stats import ROLLUPS, _stats_stmt, _fresh_response
+from app.database import SessionLocal
+from app.models import WeatherRecord, Station
+from app.schemas import WeatherRecordOut
+from app.utils import as_celsius, as_mm
+
+
+# Previous /api/weather path: tenths columns, one WeatherRecordOut per row (as_celsius/as_mm each),
+# then FastAPI's response_model validation + dump_json
+def legacy_records_page(db, q: RecordQuery) -> bytes:
+    stmt = (
+        select(Station.code, WeatherRecord.date, WeatherRecord.tmax_tenths_c, WeatherRecord.tmin_tenths_c,
+               WeatherRecord.prcp_tenths_mm)
+        .join(Station, Station.id == WeatherRecord.station_id)
+        .where(WeatherRecord.date >= q.start_date)
+        .order_by(WeatherRecord.date, WeatherRecord.station_id)
+        .limit(q.limit)
+    )
+    results = [
+        WeatherRecordOut(station=code, date=d, tmax_c=as_celsius(tmax), tmin_c=as_celsius(tmin), prcp_mm=as_mm(prcp))
+        for code, d, tmax, tmin, prcp in db.execute(stmt).all()
+    ]
+    adapter = _adapter(list[WeatherRecordOut])
+    return adapter.dump_json(adapter.validate_python(results))
+
+
+# Previous /api/weather/stats miss path: ORM entities, one output model per row, TypeAdapter.dump_json
+def legacy_stats_page(db, granularity: str, limit: int) -> bytes:
+    model, out, periods = ROLLUPS[granularity]
+    stmt = (
+        select(model, Station.code)
+        .join(Station, Station.id == model.station_id)
+        .order_by(Station.code, *(getattr(model, p) for p in periods))
+        .limit(limit)
+    )
+    results = [
+        out(station=code, **{f: getattr(stat, f) for f in out.model_fields if f != "station"})
+        for stat, code in db.execute(stmt).all()
+    ]
+    return _adapter(list[out]).dump_json(results)
+
+
+_adapters = {}
+
+
+def _adapter(tp):
+    if tp not in _adapters:
+        _adapters[tp] = TypeAdapter(tp)
+    return _adapters[tp]
+
+
+def lean_records_page(db, q: RecordQuery) -> bytes:
+    return _records_page(db.execute(_records_stmt(q)).all(), q.limit).body
+
+
+def lean_stats_page(db, granularity: str, limit: int) -> bytes:
+    rows = db.execute(_stats_stmt(granularity, None, None, limit, 0)).all()
+    return _fresh_response(granularity, rows, ("bench",), -1, {}).body
+
+
+# Median/p95 wall time (ms) of fn() over `repeat` runs after one warm-up
+def timed(fn, repeat: int) -> dict:
+    fn()
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    samples.sort()
+    return {"median_ms": round(statistics.median(samples), 2), "p95_ms": round(samples[int(0.95 * (len(samples) - 1))], 2)}
+
+
+def main():
+    # CLI entry point: per-page latency (query + serialization) of the previous and the lean JSON paths
+    parser = argparse.ArgumentParser(description="Compare per-page latency of the previous and lean list serialization.")
+    parser.add_argument("--limit", type=int, default=1000, help="Rows per page (default: %(default)s)")
+    parser.add_argument("--repeat", type=int, default=50, help="Timed runs per case (default: %(default)s)")
+    parser.add_argument("--start-date", default="2000-01-01", help="Records page start date (default: %(default)s)")
+    args = parser.parse_args()
+
+    q = RecordQuery(None, None, date.fromisoformat(args.start_date), None, args.limit, 0, None)
+    results = {}
+    with SessionLocal() as db:
+        cases = {
+            "records": (lambda: legacy_records_page(db, q), lambda: lean_records_page(db, q)),
+            "stats_month": (lambda: legacy_stats_page(db, "month", args.limit), lambda: lean_stats_page(db, "month", args.limit)),
+        }
+        for name, (legacy, lean) in cases.items():
+            same = json.loads(legacy()) == json.loads(lean())
+            results[name] = {"legacy": timed(legacy, args.repeat), "lean": timed(lean, args.repeat), "same_json": same}
+            results[name]["speedup"] = round(results[name]["legacy"]["median_ms"] / results[name]["lean"]["median_ms"], 2)
+    print(json.dumps({"limit": args.limit, "repeat": args.repeat, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import argparse
+import logging
+import os
+import time
+from contextlib import ExitStack
+
+from app.database import SessionLocal, ShardSessionLocal, SHARDED
+from app.shards import create_schema
+from app.snapshot import build_snapshot, SNAPSHOT_DIR
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+
+def main():
+    # CLI entry point: export weather_records into the memory-mapped snapshot read by /api/weather
+    parser = argparse.ArgumentParser(description="Build the columnar weather_records snapshot.")
+    parser.add_argument("--out", default=SNAPSHOT_DIR,
+                        help="Snapshot directory (default: $WEATHER_SNAPSHOT_DIR)")
+    args = parser.parse_args()
+    if not args.out:
+        parser.error("--out is required when WEATHER_SNAPSHOT_DIR is not set")
+
+    create_schema()  # ensure DB schema exists
+
+    t0 = time.perf_counter()
+    with ExitStack() as stack:
+        if SHARDED:
+            db = [stack.enter_context(make_session()) for make_session in ShardSessionLocal]
+        else:
+            db = stack.enter_context(SessionLocal())
+        rows = build_snapshot(db, args.out)
+    elapsed = time.perf_counter() - t0
+    size = sum(e.stat().st_size for e in os.scandir(args.out))
+    logging.info("Snapshot written to %s: %d rows, %.1f MB in %.2fs", args.out, rows, size / 1e6, elapsed)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,21 +1,53 @@
 import argparse
 import logging
+import time
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime, UTC
+from itertools import repeat
 
-from sqlalchemy import select, func
+from sqlalchemy import select, func, true, delete, exists
 from sqlalchemy.orm import Session
 from sqlalchemy.types import Integer
 from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
-from app.database import Base, engine, SessionLocal
-from app.models import WeatherRecord, WeatherStat, Station
+from app.cache import bump_stats_generation
+from app.database import SessionLocal, SHARD_COUNT, SHARDED, shard_engines, ShardSessionLocal
+from app.metrics import registry
+from app.models import (
+    WeatherRecord, WeatherStat, WeatherStatMonthly, WeatherStatDecade, Station, StatsDirty,
+    record_strftime, record_date_from_text,
+)
+from app.shards import create_schema
+from app.sketches import rebuild_all_sketches
 
 logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
 
+# Counters written by --metrics-file (Prometheus textfile format)
+STATION_SECONDS = registry.histogram("stats_station_duration_seconds", "Per-station recompute time (per-station mode)")
+ROLLUP_SECONDS = registry.gauge("stats_rollup_seconds", "Bulk INSERT ... SELECT time per rollup", ("granularity",))
+ROWS_WRITTEN = registry.gauge("stats_rows_written", "Yearly stats rows upserted by the last run", ("mode",))
+RUN_SECONDS = registry.gauge("stats_run_seconds", "Duration of the last stats run", ("mode",))
+
+MODES = ("bulk", "per-station")  # One INSERT ... SELECT for all stations, or one GROUP BY per station
+DEFAULT_MODE = "bulk"
+STAT_COLUMNS = ("avg_tmax_c", "avg_tmin_c", "total_prcp_cm", "count_tmax", "count_tmin", "count_prcp")
+
+# Period expressions over weather_records dates (text or day-number storage, see RECORDS_LAYOUT)
+YEAR_EXPR = func.cast(record_strftime("%Y"), Integer)
+MONTH_EXPR = func.cast(record_strftime("%m"), Integer)
+DECADE_EXPR = (YEAR_EXPR // 10) * 10
+
+# Rollup table per granularity: (model, period columns -> expressions grouped by)
+ROLLUPS = {
+    "year": (WeatherStat, {"year": YEAR_EXPR}),
+    "month": (WeatherStatMonthly, {"year": YEAR_EXPR, "month": MONTH_EXPR}),
+    "decade": (WeatherStatDecade, {"decade": DECADE_EXPR}),
+}
+
 
 def compute_and_upsert_stats(db: Session, station_id: int):
     # Extract year from date (SQLite strftime) and cast to Integer for grouping
-    year_expr = func.cast(func.strftime("%Y", WeatherRecord.date), Integer)
+    year_expr = YEAR_EXPR
 
     # Aggregate yearly averages and totals for this station
     q = (
@@ -62,28 +94,206 @@ def compute_and_upsert_stats(db: Session, station_id: int):
         )
         db.execute(stmt)
 
+    # Monthly/decade rollups for this station in set-based statements
+    for granularity in ("month", "decade"):
+        model, periods = ROLLUPS[granularity]
+        agg = (
+            select(WeatherRecord.station_id, *(e.label(n) for n, e in periods.items()), *_aggregate_columns())
+            .where(WeatherRecord.station_id == station_id)
+            .group_by(WeatherRecord.station_id, *periods.values())
+        )
+        _upsert_aggregates(db, model, tuple(periods), agg)
+
+    # Every year of this station is now fresh; bump the generation so API caches invalidate on commit
+    db.execute(delete(StatsDirty).where(StatsDirty.station_id == station_id))
+    bump_stats_generation(db)
     db.commit()
 
 
-def main():
-    # Ensure all DB tables exist
-    Base.metadata.create_all(bind=engine)
+def _upsert_aggregates(db: Session, model, periods: tuple[str, ...], agg) -> int:
+    # INSERT ... SELECT the aggregate query into a stats/rollup table, updating rows that already exist
+    stmt = sqlite_insert(model).from_select(["station_id", *periods, *STAT_COLUMNS], agg)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=["station_id", *periods],
+        set_={col: stmt.excluded[col] for col in STAT_COLUMNS},
+    )
+    return db.execute(stmt).rowcount or 0
+
 
-    start = datetime.now(UTC)
-    logging.info("Stats computation started at %s", start.isoformat())
+def _aggregate_columns():
+    # Yearly aggregates with the tenths -> °C / cm conversion done in SQL
+    return (
+        (func.avg(WeatherRecord.tmax_tenths_c) / 10.0).label("avg_tmax_c"),
+        (func.avg(WeatherRecord.tmin_tenths_c) / 10.0).label("avg_tmin_c"),
+        (func.sum(WeatherRecord.prcp_tenths_mm) / 100.0).label("total_prcp_cm"),
+        func.count(WeatherRecord.tmax_tenths_c).label("count_tmax"),
+        func.count(WeatherRecord.tmin_tenths_c).label("count_tmin"),
+        func.count(WeatherRecord.prcp_tenths_mm).label("count_prcp"),
+    )
+
+
+def compute_all_stats(db: Session) -> int:
+    # Set-based recompute: aggregate every (station, period) per rollup table in one
+    # INSERT ... SELECT ... GROUP BY with an ON CONFLICT upsert. Clears the dirty set.
+    # Returns yearly rows written.
+    counts = {}
+    for granularity, (model, periods) in ROLLUPS.items():
+        t0 = time.perf_counter()
+        agg = (
+            select(WeatherRecord.station_id, *(e.label(n) for n, e in periods.items()), *_aggregate_columns())
+            # SQLite needs a WHERE before ON CONFLICT in INSERT ... SELECT to parse unambiguously
+            .where(true())
+            .group_by(WeatherRecord.station_id, *periods.values())
+        )
+        counts[granularity] = _upsert_aggregates(db, model, tuple(periods), agg)
+        ROLLUP_SECONDS.set(time.perf_counter() - t0, granularity)
+    db.execute(delete(StatsDirty))
+    bump_stats_generation(db)
+    db.commit()
+    return counts["year"]
+
+
+def compute_dirty_stats(db: Session) -> int:
+    # Incremental recompute: re-aggregate only the station-years listed in stats_dirty
+    # (each as a date range on the (station_id, date) index), then clear them. Returns rows written.
+    if not db.execute(select(exists().select_from(StatsDirty))).scalar():
+        return 0
+    # Drive the joins from stats_dirty so SQLite range-scans ix_records_station_date per dirty period
+    in_dirty_year = (
+        (WeatherRecord.station_id == StatsDirty.station_id)
+        & (WeatherRecord.date >= record_date_from_text(func.printf("%04d-01-01", StatsDirty.year)))
+        & (WeatherRecord.date < record_date_from_text(func.printf("%04d-01-01", StatsDirty.year + 1)))
+    )
+    agg = (
+        select(StatsDirty.station_id, StatsDirty.year, *_aggregate_columns())
+        .select_from(StatsDirty)
+        .join(WeatherRecord, in_dirty_year)
+        .where(true())
+        .group_by(StatsDirty.station_id, StatsDirty.year)
+    )
+    written = _upsert_aggregates(db, WeatherStat, ("year",), agg)
 
-    # Process each station in the DB
-    with SessionLocal() as db:
+    agg = (
+        select(StatsDirty.station_id, StatsDirty.year, MONTH_EXPR.label("month"), *_aggregate_columns())
+        .select_from(StatsDirty)
+        .join(WeatherRecord, in_dirty_year)
+        .where(true())
+        .group_by(StatsDirty.station_id, StatsDirty.year, MONTH_EXPR)
+    )
+    _upsert_aggregates(db, WeatherStatMonthly, ("year", "month"), agg)
+
+    # A decade is re-aggregated in full if any of its years is dirty (distinct, so it is scanned once)
+    dirty_decades = (
+        select(StatsDirty.station_id, ((StatsDirty.year // 10) * 10).label("decade"))
+        .distinct()
+        .subquery()
+    )
+    agg = (
+        select(dirty_decades.c.station_id, dirty_decades.c.decade, *_aggregate_columns())
+        .select_from(dirty_decades)
+        .join(
+            WeatherRecord,
+            (WeatherRecord.station_id == dirty_decades.c.station_id)
+            & (WeatherRecord.date >= record_date_from_text(func.printf("%04d-01-01", dirty_decades.c.decade)))
+            & (WeatherRecord.date < record_date_from_text(func.printf("%04d-01-01", dirty_decades.c.decade + 10))),
+        )
+        .where(true())
+        .group_by(dirty_decades.c.station_id, dirty_decades.c.decade)
+    )
+    _upsert_aggregates(db, WeatherStatDecade, ("decade",), agg)
+    db.execute(delete(StatsDirty))
+    bump_stats_generation(db)
+    db.commit()
+    return written
+
+
+def run_stats(db: Session, mode: str, incremental: bool, rebuild_sketches: bool) -> int | None:
+    # One stats run against one DB (the single DB or a shard); returns yearly rows written (None per-station)
+    if incremental:
+        written = compute_dirty_stats(db)
+        logging.info("Upserted %d dirty station-year rows", written)
+    elif mode == "bulk":
+        written = compute_all_stats(db)
+        logging.info("Upserted %d station-year rows", written)
+    else:
+        # Process each station in the DB
         station_ids = [sid for (sid,) in db.execute(select(Station.id)).all()]
         for sid in station_ids:
+            t_station = time.perf_counter()
             compute_and_upsert_stats(db, sid)
+            STATION_SECONDS.observe(time.perf_counter() - t_station)
+        written = None
+        logging.info("Processed %d stations", len(station_ids))
+    if rebuild_sketches:
+        # Backfill percentile sketches (ingest maintains them; older DBs have none)
+        logging.info("Rebuilt sketches for %d station-years", rebuild_all_sketches(db))
+    return written
+
 
+def _run_shard_stats(shard: int, mode: str, incremental: bool, rebuild_sketches: bool) -> int | None:
+    # Worker process: stats run on one shard (stats tables live next to the shard's records)
+    shard_engines[shard].dispose(close=False)  # don't reuse connections inherited from the parent
+    with ShardSessionLocal[shard]() as db:
+        return run_stats(db, mode, incremental, rebuild_sketches)
+
+
+def main(
+    mode: str = DEFAULT_MODE,
+    incremental: bool = False,
+    metrics_file: str | None = None,
+    rebuild_sketches: bool = False,
+):
+    # Ensure all DB tables exist (in the configured records layout)
+    create_schema()
+
+    start = datetime.now(UTC)
+    logging.info(
+        "Stats computation started at %s (mode=%s%s%s)",
+        start.isoformat(), mode, ", incremental" if incremental else "",
+        f", {SHARD_COUNT} shards" if SHARDED else "",
+    )
+    t0 = time.perf_counter()
+
+    if SHARDED:
+        # Shards are independent: aggregate them in parallel, then bump the catalog generation the API reads.
+        # Per-rollup and per-station timings stay in the worker processes; only run totals are recorded.
+        with ProcessPoolExecutor(max_workers=SHARD_COUNT) as pool:
+            results = list(pool.map(
+                _run_shard_stats, range(SHARD_COUNT),
+                repeat(mode), repeat(incremental), repeat(rebuild_sketches),
+            ))
+        written = None if None in results else sum(results)
+        with SessionLocal() as db:
+            bump_stats_generation(db)
+            db.commit()
+    else:
+        with SessionLocal() as db:
+            written = run_stats(db, mode, incremental, rebuild_sketches)
+
+    elapsed = time.perf_counter() - t0
     end = datetime.now(UTC)
-    logging.info("Stats computation finished at %s", end.isoformat())
+    logging.info("Stats computation finished at %s (%.2fs)", end.isoformat(), elapsed)
+
+    if metrics_file:
+        label = "incremental" if incremental else mode
+        RUN_SECONDS.set(elapsed, label)
+        if written is not None:
+            ROWS_WRITTEN.set(written, label)
+        registry.write(metrics_file)
 
 
 if __name__ == "__main__":
-    # argparse placeholder (future extensibility)
-    parser = argparse.ArgumentParser(description="Compute yearly stats and store in weather_stats table.")
-    _ = parser.parse_args()
-    main()
+    parser = argparse.ArgumentParser(
+        description="Compute yearly stats (weather_stats) and monthly/decade rollups (weather_stats_monthly/_decade)."
+    )
+    parser.add_argument("--mode", choices=MODES, default=DEFAULT_MODE,
+                        help="bulk: single set-based statement; per-station: one query per station (default: %(default)s)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only recompute station-years that ingestion marked dirty (uses the bulk statement)")
+    parser.add_argument("--metrics-file", help="Write run timings in Prometheus text format to this file")
+    parser.add_argument("--rebuild-sketches", action="store_true",
+                        help="Also rebuild every station-year's percentile sketches from weather_records")
+    args = parser.parse_args()
+    if args.incremental and args.mode != "bulk":
+        parser.error("--incremental requires --mode bulk")
+    main(args.mode, args.incremental, args.metrics_file, args.rebuild_sketches)
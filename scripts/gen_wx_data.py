@@ -0,0 +1,80 @@
+import argparse
+import logging
+import os
+
+import numpy as np
+
+from scripts.ingest_weather import MISSING
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+DEFAULT_START_YEAR = 1985
+
+
+# Write `stations` synthetic station files in the wx_data format (YYYYMMDD<TAB>tmax<TAB>tmin<TAB>prcp, tenths,
+# -9999 = missing). Each value is missing with probability missing_rate; a line is replaced by a truncated,
+# malformed one (skipped by the ingest parsers) with probability malformed_rate.
+# Returns {"files", "lines", "rows", "malformed"}; rows = well-formed lines ingestion should load.
+def generate(
+    out_dir: str,
+    stations: int,
+    years: int,
+    start_year: int = DEFAULT_START_YEAR,
+    missing_rate: float = 0.02,
+    malformed_rate: float = 0.0,
+    seed: int = 0,
+) -> dict:
+    os.makedirs(out_dir, exist_ok=True)
+    rng = np.random.default_rng(seed)
+    days = np.arange(np.datetime64(f"{start_year}-01-01"), np.datetime64(f"{start_year + years}-01-01"))
+    ymd = [d.strftime("%Y%m%d") for d in days.tolist()]
+    day_of_year = (days - days.astype("datetime64[Y]")).astype(np.int64)
+    season = np.cos(2 * np.pi * (day_of_year - 200) / 365.25)
+
+    totals = {"files": 0, "lines": 0, "rows": 0, "malformed": 0}
+    for s in range(stations):
+        n = len(days)
+        # Station climate offset + seasonal cycle + daily noise, in tenths
+        base = rng.normal(120, 60)
+        tmax = np.rint(base + 150 * season + rng.normal(0, 40, n)).astype(np.int64)
+        tmin = tmax - np.rint(rng.uniform(50, 150, n)).astype(np.int64)
+        prcp = np.where(rng.random(n) < 0.3, np.rint(rng.exponential(60, n)), 0).astype(np.int64)
+        values = np.stack([tmax, tmin, prcp], axis=1)
+        values[rng.random(values.shape) < missing_rate] = MISSING
+        malformed = rng.random(n) < malformed_rate
+
+        lines = [
+            f"{d}\t{a:5d}" if bad else f"{d}\t{a:5d}\t{b:5d}\t{c:5d}"
+            for d, (a, b, c), bad in zip(ymd, values.tolist(), malformed.tolist())
+        ]
+        with open(os.path.join(out_dir, f"SYN{s:05d}.txt"), "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        bad = int(malformed.sum())
+        totals["files"] += 1
+        totals["lines"] += n
+        totals["rows"] += n - bad
+        totals["malformed"] += bad
+    return totals
+
+
+def main():
+    # CLI entry point: write a synthetic wx_data-style directory
+    parser = argparse.ArgumentParser(description="Generate synthetic station files in the wx_data format.")
+    parser.add_argument("--out", required=True, help="Output directory")
+    parser.add_argument("--stations", type=int, default=10, help="Number of station files (default: %(default)s)")
+    parser.add_argument("--years", type=int, default=30, help="Years of daily data per station (default: %(default)s)")
+    parser.add_argument("--start-year", type=int, default=DEFAULT_START_YEAR, help="First year (default: %(default)s)")
+    parser.add_argument("--missing-rate", type=float, default=0.02,
+                        help="Probability that a value is -9999 (default: %(default)s)")
+    parser.add_argument("--malformed-rate", type=float, default=0.0,
+                        help="Probability that a line is truncated/malformed (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0, help="Random seed (default: %(default)s)")
+    args = parser.parse_args()
+    totals = generate(args.out, args.stations, args.years, args.start_year,
+                      args.missing_rate, args.malformed_rate, args.seed)
+    logging.info("Wrote %d files, %d lines (%d malformed) to %s",
+                 totals["files"], totals["lines"], totals["malformed"], args.out)
+
+
+if __name__ == "__main__":
+    main()
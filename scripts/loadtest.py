@@ -0,0 +1,243 @@
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+
+import httpx
+
+from scripts.bench_pipeline import run_step
+from scripts.gen_wx_data import generate, DEFAULT_START_YEAR
+
+logging.getLogger("httpx").setLevel(logging.WARNING)  # no per-request log lines from the client
+
+# Query scenarios and their default weights in the replayed mix
+DEFAULT_MIX = {
+    "station_year": 4,       # one station, one year of daily records
+    "station_month": 2,      # one station, one month
+    "date_all_stations": 2,  # one day across all stations
+    "deep_offset": 1,        # unfiltered page at a large offset
+    "stats_year": 2,         # all stations' stats for one year
+    "stats_station": 1,      # one station's yearly stats
+}
+
+
+# Launch uvicorn serving app.main:app with extra env vars; returns the process once /ready answers (warm-up done)
+def start_server(port: int, workers: int, env: dict[str, str]) -> subprocess.Popen:
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        env={**os.environ, **env},
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            if httpx.get(f"http://127.0.0.1:{port}/ready", timeout=1).status_code == 200:
+                return proc
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    proc.terminate()
+    raise RuntimeError("server did not become ready within 30s")
+
+
+# Create a temp SQLite DB from synthetic wx_data (ingest + stats); returns (database_url, work_dir)
+def seed_database(stations: int, years: int, seed: int) -> tuple[str, str]:
+    work_dir = tempfile.mkdtemp(prefix="wx-load-")
+    data_dir = os.path.join(work_dir, "wx_data")
+    generate(data_dir, stations, years, DEFAULT_START_YEAR, seed=seed)
+    url = f"sqlite:///{os.path.join(work_dir, 'load.db')}"
+    env = {**os.environ, "DATABASE_URL": url}
+    run_step("scripts.ingest_weather", ["--data-dir", data_dir], env)
+    run_step("scripts.compute_stats", [], env)
+    return url, work_dir
+
+
+# Station codes and years present in the target API, read from /api/weather/stats
+def discover(base_url: str) -> tuple[list[str], list[int]]:
+    stations, years = set(), set()
+    offset = 0
+    while True:
+        page = httpx.get(f"{base_url}/api/weather/stats", params={"limit": 1000, "offset": offset}, timeout=60).json()
+        for row in page:
+            stations.add(row["station"])
+            years.add(row["year"])
+        if len(page) < 1000:
+            break
+        offset += 1000
+    if not stations:
+        raise RuntimeError("no stats in the target DB; run scripts.compute_stats first")
+    return sorted(stations), sorted(years)
+
+
+# Deterministic request plan: `total` (scenario, path) pairs drawn from the weighted mix with a fixed seed,
+# so runs against different configurations replay the same queries
+def build_plan(mix: dict[str, int], stations: list[str], years: list[int], total: int, seed: int,
+               max_offset: int) -> list[tuple[str, str]]:
+    rng = random.Random(seed)
+    names = [n for n, w in mix.items() if w > 0]
+    weights = [mix[n] for n in names]
+
+    def path(name: str) -> str:
+        station, year = rng.choice(stations), rng.choice(years)
+        if name == "station_year":
+            return f"/api/weather?station={station}&start_date={year}-01-01&end_date={year}-12-31&limit=366"
+        if name == "station_month":
+            month = rng.randint(1, 12)
+            return f"/api/weather?station={station}&start_date={year}-{month:02d}-01&end_date={year}-{month:02d}-28&limit=31"
+        if name == "date_all_stations":
+            return f"/api/weather?on_date={year}-{rng.randint(1, 12):02d}-{rng.randint(1, 28):02d}&limit=1000"
+        if name == "deep_offset":
+            return f"/api/weather?limit=100&offset={rng.randint(0, max_offset)}"
+        if name == "stats_year":
+            return f"/api/weather/stats?year={year}&limit=1000"
+        if name == "stats_station":
+            return f"/api/weather/stats?station={station}"
+        raise ValueError(f"unknown scenario {name!r}")
+
+    return [(name, path(name)) for name in rng.choices(names, weights, k=total)]
+
+
+# Replay the plan over `concurrency` clients; returns (scenario, latency_s, error kind or None) per request
+async def run_load(base_url: str, plan: list[tuple[str, str]], concurrency: int) -> list[tuple[str, float, str | None]]:
+    samples = []
+    todo = iter(plan)
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=60) as client:
+        async def worker():
+            for name, path in todo:
+                t0 = time.perf_counter()
+                try:
+                    resp = await client.get(path)
+                    error = f"http_{resp.status_code}" if resp.status_code >= 400 else None
+                except httpx.HTTPError as exc:
+                    error = type(exc).__name__
+                samples.append((name, time.perf_counter() - t0, error))
+
+        await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return samples
+
+
+def summarize(latencies: list[float], errors: dict[str, int], elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    pct = lambda p: ordered[min(len(ordered) - 1, int(p / 100 * len(ordered)))] * 1000  # noqa: E731
+    return {
+        "requests": len(latencies),
+        "errors": sum(errors.values()),
+        "error_kinds": dict(sorted(errors.items())),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 2) if latencies else 0.0,
+        "p50_ms": round(pct(50), 2) if latencies else 0.0,
+        "p95_ms": round(pct(95), 2) if latencies else 0.0,
+        "p99_ms": round(pct(99), 2) if latencies else 0.0,
+    }
+
+
+# Overall and per-scenario summaries; per-scenario throughput is that scenario's share of the run
+def report(samples: list[tuple[str, float, str | None]], elapsed: float) -> dict:
+    by_name = defaultdict(list)
+    errors = defaultdict(lambda: defaultdict(int))
+    for name, latency, error in samples:
+        by_name[name].append(latency)
+        if error:
+            errors[name][error] += 1
+    overall_errors = defaultdict(int)
+    for kinds in errors.values():
+        for kind, n in kinds.items():
+            overall_errors[kind] += n
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "overall": summarize([s[1] for s in samples], overall_errors, elapsed),
+        "scenarios": {name: summarize(lat, errors[name], elapsed) for name, lat in sorted(by_name.items())},
+    }
+
+
+# Parse "name=weight,name=weight" into a mix (unknown names rejected)
+def parse_mix(text: str | None) -> dict[str, int]:
+    if not text:
+        return dict(DEFAULT_MIX)
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name not in DEFAULT_MIX:
+            raise ValueError(f"unknown scenario {name!r} (choose from {', '.join(DEFAULT_MIX)})")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+def main():
+    # CLI entry point: replay a weighted query mix from concurrent clients and report per-scenario latencies
+    parser = argparse.ArgumentParser(description="Concurrent load test against the weather API.")
+    parser.add_argument("--url", help="Base URL of a running server (default: start one locally)")
+    parser.add_argument("--port", type=int, default=8765, help="Port for the locally started server")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes for the local server")
+    parser.add_argument("--env", action="append", default=[], metavar="KEY=VALUE",
+                        help="Extra environment for the local server, e.g. DB_ASYNC=1 (repeatable)")
+    parser.add_argument("--use-database-url", action="store_true",
+                        help="Serve the DB in $DATABASE_URL instead of seeding a temp one")
+    parser.add_argument("--seed-stations", type=int, default=20, help="Synthetic stations in the seeded DB")
+    parser.add_argument("--seed-years", type=int, default=10, help="Years per station in the seeded DB")
+    parser.add_argument("--mix", help=f"Scenario weights, e.g. station_year=4,stats_year=1 (scenarios: {', '.join(DEFAULT_MIX)})")
+    parser.add_argument("--max-offset", type=int, default=100_000, help="Upper bound for deep_offset offsets")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for data and the request plan")
+    parser.add_argument("--requests", type=int, default=2000, help="Total requests")
+    parser.add_argument("--concurrency", type=int, default=32, help="Concurrent clients")
+    parser.add_argument("--output", help="Also write the JSON result to this file")
+    args = parser.parse_args()
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as exc:
+        parser.error(str(exc))
+
+    env = dict(kv.split("=", 1) for kv in args.env)
+    proc = None
+    work_dir = None
+    base_url = args.url
+    seeded = None
+    try:
+        if not base_url:
+            if not args.use_database_url:
+                env["DATABASE_URL"], work_dir = seed_database(args.seed_stations, args.seed_years, args.seed)
+                seeded = {"stations": args.seed_stations, "years": args.seed_years}
+            proc = start_server(args.port, args.workers, env)
+            base_url = f"http://127.0.0.1:{args.port}"
+
+        stations, years = discover(base_url)
+        # Keep deep offsets inside the data (roughly one record per station-day)
+        max_offset = max(0, min(args.max_offset, len(stations) * len(years) * 365 - 100))
+        plan = build_plan(mix, stations, years, args.requests, args.seed, max_offset)
+        asyncio.run(run_load(base_url, plan[:min(len(plan), 2 * args.concurrency)], args.concurrency))  # warm-up
+        t0 = time.perf_counter()
+        samples = asyncio.run(run_load(base_url, plan, args.concurrency))
+        result = report(samples, time.perf_counter() - t0)
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+        if work_dir:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    if seeded:
+        env.pop("DATABASE_URL")  # temp path, not part of the configuration
+    result["config"] = {
+        "workers": args.workers, "concurrency": args.concurrency, "requests": args.requests, "seed": args.seed,
+        "mix": mix, "env": env, "seeded_db": seeded, "stations": len(stations), "years": [years[0], years[-1]],
+    }
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+
+
+if __name__ == "__main__":
+    main()
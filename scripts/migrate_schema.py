@@ -0,0 +1,87 @@
+import argparse
+import logging
+import time
+
+from sqlalchemy import text
+from sqlalchemy.schema import CreateTable
+
+from app.database import engine, shard_engines, RECORDS_LAYOUT, SHARDED
+from app.models import WeatherRecord, detect_records_layout, JULIAN_DAY_EPOCH
+from app.shards import create_schema
+
+logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+
+OLD_TABLE = "weather_records_old"
+VALUE_COLUMNS = "tmax_tenths_c, tmin_tenths_c, prcp_tenths_mm"
+
+# SQL converting the source date column into the target layout's storage
+DATE_CONVERSIONS = {
+    ("standard", "compact"): f"CAST(julianday(date) - {JULIAN_DAY_EPOCH} AS INTEGER)",
+    ("compact", "standard"): "date(date * 86400, 'unixepoch')",
+}
+
+
+def migrate_records(target: str = RECORDS_LAYOUT, vacuum: bool = True, bind=None) -> int:
+    # Rebuild weather_records in the target layout: rename the old table, create the new one without
+    # indexes, copy rows in (station_id, date) order, build indexes, drop the old table. One transaction:
+    # pysqlite doesn't open one for DDL (the RENAME would commit on its own), so BEGIN is issued explicitly
+    # and a failed copy rolls back to the original table.
+    # Returns the number of rows copied (0 if the table is already in the target layout).
+    bind = engine if bind is None else bind
+    with bind.connect() as conn:
+        source = detect_records_layout(conn)
+    if source is None:
+        logging.info("No weather_records table yet; it will be created in the %s layout", target)
+        return 0
+    if source == target:
+        logging.info("weather_records already uses the %s layout", target)
+        return 0
+
+    table = WeatherRecord.__table__
+    with bind.begin() as conn:
+        conn.exec_driver_sql("BEGIN")
+        old_indexes = conn.execute(
+            text("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = :t AND sql IS NOT NULL"),
+            {"t": table.name},
+        ).scalars().all()
+        conn.execute(text(f"ALTER TABLE {table.name} RENAME TO {OLD_TABLE}"))
+        # Free the index names for the new table (autoindexes of constraints go with the old table)
+        for name in old_indexes:
+            conn.execute(text(f'DROP INDEX "{name}"'))
+        conn.execute(CreateTable(table))
+        copied = conn.execute(text(
+            f"INSERT INTO {table.name} (station_id, date, {VALUE_COLUMNS}) "
+            f"SELECT station_id, {DATE_CONVERSIONS[source, target]}, {VALUE_COLUMNS} "
+            f"FROM {OLD_TABLE} ORDER BY station_id, date"
+        )).rowcount
+        for index in table.indexes:
+            index.create(conn)
+        conn.execute(text(f"DROP TABLE {OLD_TABLE}"))
+
+    if vacuum:
+        # Return the old table's pages to the filesystem
+        with bind.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+    return copied
+
+
+def main():
+    # CLI entry point: convert an existing DB to the layout selected by RECORDS_LAYOUT
+    parser = argparse.ArgumentParser(
+        description="Convert weather_records to the storage layout selected by RECORDS_LAYOUT (standard|compact)."
+    )
+    parser.add_argument("--no-vacuum", action="store_true", help="Skip VACUUM after the copy (file keeps its size)")
+    args = parser.parse_args()
+    if not engine.dialect.name == "sqlite":
+        parser.error("schema migration is implemented for SQLite only")
+
+    t0 = time.perf_counter()
+    # Sharded: every shard holds its own weather_records (the catalog has none)
+    engines = shard_engines if SHARDED else [engine]
+    copied = sum(migrate_records(RECORDS_LAYOUT, vacuum=not args.no_vacuum, bind=eng) for eng in engines)
+    create_schema()  # tables that did not exist yet
+    logging.info("Migrated %d rows to the %s layout in %.2fs", copied, RECORDS_LAYOUT, time.perf_counter() - t0)
+
+
+if __name__ == "__main__":
+    main()
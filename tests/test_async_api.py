@@ -0,0 +1,37 @@
+from datetime import date
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from app.api.routers import weather, weather_stats
+from app.database import SessionLocal
+from app.models import Station, WeatherRecord
+from scripts.compute_stats import compute_and_upsert_stats
+
+
+def test_async_handlers_match_sync(client):
+    with SessionLocal() as db:
+        st = Station(code="ASYNC001")
+        db.add(st); db.commit(); db.refresh(st)
+        db.add_all([
+            WeatherRecord(station_id=st.id, date=date(1986, 3, d), tmax_tenths_c=d, tmin_tenths_c=None, prcp_tenths_mm=d)
+            for d in range(1, 5)
+        ])
+        db.commit()
+        compute_and_upsert_stats(db, st.id)
+
+    # Mount the async variants on a separate app; both share the same DB
+    async_app = FastAPI()
+    async_app.add_api_route("/w", weather.list_weather_async, methods=["GET"])
+    async_app.add_api_route("/s", weather_stats.list_weather_stats_async, methods=["GET"])
+    async_app.add_api_route("/b", weather.batch_weather_async, methods=["POST"])
+    with TestClient(async_app) as async_client:
+        params = {"station": "ASYNC001", "limit": 3}
+        sync_resp = client.get("/api/weather", params=params)
+        async_resp = async_client.get("/w", params=params)
+        assert async_resp.json() == sync_resp.json()
+        assert async_resp.headers["X-Next-Cursor"] == sync_resp.headers["X-Next-Cursor"]
+
+        params = {"station": "ASYNC001"}
+        assert async_client.get("/s", params=params).json() == client.get("/api/weather/stats", params=params).json()
+
+        body = {"selectors": [{"station": "ASYNC001", "limit": 2}, {"station": "NOPE0000"}]}
+        assert async_client.post("/b", json=body).json() == client.post("/api/weather/batch", json=body).json()
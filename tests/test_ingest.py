@@ -1,7 +1,7 @@
 import os
 from app.database import SessionLocal
 from app.models import Station, WeatherRecord
-from scripts.ingest_weather import ingest_file
+from scripts.ingest_weather import ingest_file, ingest_parallel, iter_batches, check_manifest, record_manifest
 
 def test_ingest_idempotent(tmp_path):
     # Create a temporary fake station data file with 3 days (1 missing values row)
@@ -29,3 +29,97 @@ def test_ingest_idempotent(tmp_path):
         assert st is not None
         rows = db.query(WeatherRecord).filter_by(station_id=st.id).all()
         assert len(rows) == 3
+
+def test_ingest_batches_partial_duplicates(tmp_path):
+    # Batch boundaries must not affect counts when only some rows are new
+    lines = [f"198502{d:02d}\t{d}\t-{d}\t0" for d in range(1, 8)]
+    fpath = tmp_path / "TEST0002.txt"
+    fpath.write_text("\n".join(lines[:4]), encoding="utf-8")
+
+    with SessionLocal() as db:
+        assert ingest_file(db, "TEST0002", str(fpath), batch_size=3) == (4, 4)
+
+        # File grows by three days; re-ingest with a different batch size
+        fpath.write_text("\n".join(lines), encoding="utf-8")
+        assert ingest_file(db, "TEST0002", str(fpath), batch_size=2) == (7, 3)
+
+        st = db.query(Station).filter_by(code="TEST0002").one()
+        assert db.query(WeatherRecord).filter_by(station_id=st.id).count() == 7
+
+
+def test_ingest_parallel_matches_serial(tmp_path):
+    # Parallel parsing must yield per-file counts in input order, same as serial ingestion
+    files = []
+    for n in range(3):
+        fpath = tmp_path / f"TESTP{n:03d}.txt"
+        fpath.write_text("\n".join(f"199001{d:02d}\t{n}\t{d}\t-9999" for d in range(1, 6 + n)), encoding="utf-8")
+        files.append((f"TESTP{n:03d}", str(fpath), 0))
+
+    with SessionLocal() as db:
+        results = list(ingest_parallel(db, files, workers=2, batch_size=2))
+        assert [(c, p, i) for c, _, p, i in results] == [
+            ("TESTP000", 5, 5), ("TESTP001", 6, 6), ("TESTP002", 7, 7),
+        ]
+        # Re-run is idempotent
+        results = list(ingest_parallel(db, files, workers=2))
+        assert [i for *_, i in results] == [0, 0, 0]
+
+
+def test_numpy_parser_matches_line_parser(tmp_path):
+    # Vectorized parser must skip the same malformed lines and map -9999 the same way
+    content = "\n".join([
+        "19850101\t100\t-50\t123",
+        "",
+        "19850102\t-9999\t-9999",          # wrong field count -> skipped
+        "19850103\t-9999\t7\t-9999",
+        "19850104 1 2 3 4",                # wrong field count -> skipped
+        "19850105\t222\t111\t0",
+    ])
+    fpath = tmp_path / "TEST0003.txt"
+    fpath.write_text(content, encoding="utf-8")
+
+    line_rows = [r for b in iter_batches(str(fpath), 2, parser="line") for r in b]
+    numpy_rows = [r for b in iter_batches(str(fpath), 2, parser="numpy") for r in b]
+    assert numpy_rows == line_rows
+    assert [r["date"].day for r in numpy_rows] == [1, 3, 5]
+    assert numpy_rows[1]["tmax_tenths_c"] is None and numpy_rows[1]["tmin_tenths_c"] == 7
+
+
+def test_manifest_skips_unchanged_and_reads_appended_tail(tmp_path):
+    fpath = tmp_path / "TEST0004.txt"
+    fpath.write_text("19850101\t1\t1\t1\n19850102\t2\t2\t2\n", encoding="utf-8")
+
+    with SessionLocal() as db:
+        offset, state = check_manifest(db, str(fpath))
+        assert offset == 0
+        assert ingest_file(db, "TEST0004", str(fpath), offset=offset) == (2, 2)
+        record_manifest(db, str(fpath), state)
+
+        # Unchanged file: nothing to read
+        assert check_manifest(db, str(fpath))[0] is None
+
+        # Appended day: only the tail past the recorded offset is parsed
+        with open(fpath, "a", encoding="utf-8") as f:
+            f.write("19850103\t3\t3\t3\n")
+        offset, state = check_manifest(db, str(fpath))
+        assert offset == state.offset - len("19850103\t3\t3\t3\n")
+        assert ingest_file(db, "TEST0004", str(fpath), offset=offset) == (1, 1)
+        record_manifest(db, str(fpath), state)
+
+        # Rewritten content: back to a full read (duplicates still skipped)
+        fpath.write_text("19850101\t9\t9\t9\n", encoding="utf-8")
+        assert check_manifest(db, str(fpath))[0] == 0
+
+
+def test_generated_wx_data_ingests_all_wellformed_rows(tmp_path):
+    from scripts.gen_wx_data import generate
+    totals = generate(str(tmp_path), stations=2, years=1, start_year=1961, missing_rate=0.1, malformed_rate=0.05, seed=1)
+    assert totals["files"] == 2 and totals["lines"] == 730 and totals["malformed"] > 0
+
+    inserted = 0
+    with SessionLocal() as db:
+        for name in sorted(os.listdir(tmp_path)):
+            # Synthetic codes are SYNnnnnn; prefix them so they cannot collide with other tests
+            _, ins = ingest_file(db, "GEN" + name[:-4], str(tmp_path / name))
+            inserted += ins
+    assert inserted == totals["rows"]
@@ -0,0 +1,23 @@
+import pytest
+from scripts.loadtest import build_plan, parse_mix, report
+
+
+def test_plan_is_deterministic_and_follows_mix():
+    mix = parse_mix("station_year=3,stats_year=1")
+    plan = build_plan(mix, ["A", "B"], [1990, 1991], 400, seed=7, max_offset=1000)
+    assert plan == build_plan(mix, ["A", "B"], [1990, 1991], 400, seed=7, max_offset=1000)
+    names = [name for name, _ in plan]
+    assert set(names) == {"station_year", "stats_year"}
+    assert 250 < names.count("station_year") < 350
+    assert all(path.startswith("/api/weather/stats?year=") for name, path in plan if name == "stats_year")
+    with pytest.raises(ValueError):
+        parse_mix("nope=1")
+
+
+def test_report_groups_latencies_and_errors():
+    samples = [("a", 0.010, None), ("a", 0.030, "http_500"), ("b", 0.020, "ReadTimeout")]
+    result = report(samples, elapsed=1.0)
+    assert result["overall"]["requests"] == 3
+    assert result["overall"]["error_kinds"] == {"ReadTimeout": 1, "http_500": 1}
+    assert result["scenarios"]["a"]["p99_ms"] == 30.0
+    assert result["scenarios"]["a"]["throughput_rps"] == 2.0
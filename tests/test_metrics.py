@@ -0,0 +1,46 @@
+import logging
+
+import pytest
+
+from app import metrics
+
+# The middleware, SQL events and /metrics are wired at import; METRICS_ENABLED=0 leaves them out
+requires_metrics = pytest.mark.skipif(not metrics.METRICS_ENABLED, reason="METRICS_ENABLED=0")
+
+
+@requires_metrics
+def test_metrics_endpoint_reports_routes_and_sql(client):
+    client.get("/api/weather", params={"limit": 2})
+    client.get("/api/weather/stats", params={"station": "NOPE0000"})
+    client.get("/no-such-path")
+
+    resp = client.get("/metrics")
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("text/plain")
+    text = resp.text
+    assert "# TYPE http_request_duration_seconds histogram" in text
+    assert 'http_requests_total{method="GET",route="/api/weather",status="200"}' in text
+    # Route templates, not raw paths, label the series
+    assert 'route="unmatched",status="404"' in text
+    assert 'http_request_db_queries_count{route="/api/weather/stats"}' in text
+    assert metrics.HTTP_DB_QUERIES.count("/api/weather") >= 1
+
+
+@requires_metrics
+def test_slow_queries_are_logged(client, monkeypatch, caplog):
+    monkeypatch.setattr(metrics, "SLOW_QUERY_MS", 1e-6)
+    before = metrics.DB_SLOW_QUERIES.value()
+    with caplog.at_level(logging.WARNING, logger="app.sql.slow"):
+        client.get("/api/weather", params={"limit": 1})
+    assert metrics.DB_SLOW_QUERIES.value() > before
+    assert any("SELECT" in r.getMessage() for r in caplog.records)
+
+
+def test_histogram_text_format():
+    h = metrics.Histogram("t_seconds", "test", ("route",), buckets=(0.1, 1.0))
+    for v in (0.05, 0.5, 5.0):
+        h.observe(v, "/x")
+    lines = [f"{s} {v}" for s, v in h.samples()]
+    assert lines[:3] == ['t_seconds_bucket{route="/x",le="0.1"} 1', 't_seconds_bucket{route="/x",le="1.0"} 2',
+                         't_seconds_bucket{route="/x",le="+Inf"} 3']
+    assert lines[-1] == 't_seconds_count{route="/x"} 3'
@@ -0,0 +1,136 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter, since RECORDS_LAYOUT is read at import time. Optionally ingests and
+# computes stats, optionally migrates, then prints API responses for a fixed set of queries.
+CHILD = r"""
+import json, sys
+from app.database import SessionLocal, engine, Base
+from scripts.migrate_schema import migrate_records
+data_dir, steps = sys.argv[1], sys.argv[2].split(",")
+if "migrate" in steps:
+    migrate_records()
+from fastapi.testclient import TestClient
+from app.main import app
+from app.models import detect_records_layout
+from app.shards import create_schema
+create_schema()  # what scripts.init_db / the app startup hook do
+if "ingest" in steps:
+    from scripts.ingest_weather import ingest_file
+    from scripts.compute_stats import compute_all_stats, compute_dirty_stats
+    with SessionLocal() as db:
+        for code in ("LAY00001", "LAY00002"):
+            ingest_file(db, code, f"{data_dir}/{code}.txt")
+        compute_all_stats(db)
+        ingest_file(db, "LAY00001", f"{data_dir}/late.txt")
+        compute_dirty_stats(db)
+client = TestClient(app)
+out = {"layout": detect_records_layout(engine), "pages": []}
+params, cursor = {"limit": 4}, None
+while True:
+    resp = client.get("/api/weather", params={**params, **({"cursor": cursor} if cursor else {})})
+    out["pages"].append(resp.json())
+    cursor = resp.headers.get("X-Next-Cursor")
+    if not cursor:
+        break
+out["range"] = client.get("/api/weather", params={"station": "LAY00002", "start_date": "1999-12-31", "end_date": "2000-01-02"}).json()
+out["stats"] = [client.get("/api/weather/stats", params={"granularity": g}).json() for g in ("year", "month", "decade")]
+out["batch"] = client.post("/api/weather/batch", json={"selectors": [{"station": "LAY00001", "limit": 2}]}).json()
+print(json.dumps(out))
+"""
+
+
+def _run(db_path, data_dir, layout, steps):
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{db_path}", "RECORDS_LAYOUT": layout}
+    env.pop("WEATHER_SNAPSHOT_DIR", None)
+    proc = subprocess.run(
+        [sys.executable, "-c", CHILD, str(data_dir), steps],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(proc.stdout)
+
+
+def test_layouts_and_migration_give_identical_results(tmp_path):
+    (tmp_path / "LAY00001.txt").write_text("19991230\t10\t-10\t5\n19991231\t20\t-9999\t0\n20000101\t30\t-30\t-9999\n")
+    (tmp_path / "LAY00002.txt").write_text("19991231\t11\t-11\t1\n20000101\t-9999\t-9999\t2\n20000102\t33\t-33\t3\n")
+    (tmp_path / "late.txt").write_text("20000102\t40\t-40\t4\n")
+
+    standard = _run(tmp_path / "s.db", tmp_path, "standard", "ingest")
+    compact = _run(tmp_path / "c.db", tmp_path, "compact", "ingest")
+    assert (standard["layout"], compact["layout"]) == ("standard", "compact")
+    assert sum(len(p) for p in standard["pages"]) == 7
+    expected = {k: v for k, v in standard.items() if k != "layout"}
+    assert {k: v for k, v in compact.items() if k != "layout"} == expected
+
+    # Migrate the standard DB to compact and back; results stay the same
+    migrated = _run(tmp_path / "s.db", tmp_path, "compact", "migrate")
+    assert migrated["layout"] == "compact"
+    assert {k: v for k, v in migrated.items() if k != "layout"} == expected
+    restored = _run(tmp_path / "s.db", tmp_path, "standard", "migrate")
+    assert restored["layout"] == "standard"
+    assert {k: v for k, v in restored.items() if k != "layout"} == expected
+
+
+def test_failed_migration_rolls_back(tmp_path):
+    # Standard-layout source with one date the compact conversion can't handle (julianday -> NULL).
+    # The schema is created in a child with RECORDS_LAYOUT=standard: this process may run either layout.
+    db_path = tmp_path / "bad.db"
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{db_path}", "RECORDS_LAYOUT": "standard"}
+    subprocess.run(
+        [sys.executable, "-c", "from app.shards import create_schema; create_schema()"],
+        cwd=ROOT, env=env, capture_output=True, text=True, check=True,
+    )
+    con = sqlite3.connect(db_path)
+    con.execute("INSERT INTO stations (id, code) VALUES (1, 'BAD00001')")
+    con.executemany(
+        "INSERT INTO weather_records (station_id, date, tmax_tenths_c, tmin_tenths_c, prcp_tenths_mm) VALUES (1, ?, 1, 2, 3)",
+        [("2000-01-01",), ("garbage",)],
+    )
+    con.commit()
+    indexes = sorted(r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type = 'index'"))
+    con.close()
+
+    env["RECORDS_LAYOUT"] = "compact"
+    proc = subprocess.run(
+        [sys.executable, "-c", "from scripts.migrate_schema import migrate_records; migrate_records()"],
+        cwd=ROOT, env=env, capture_output=True, text=True,
+    )
+    assert proc.returncode != 0 and "NOT NULL constraint failed" in proc.stderr
+
+    con = sqlite3.connect(db_path)
+    tables = {r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    assert "weather_records_old" not in tables
+    assert sorted(r[0] for r in con.execute("SELECT name FROM sqlite_master WHERE type = 'index'")) == indexes
+    assert "id" in {r[1] for r in con.execute("PRAGMA table_info(weather_records)")}  # still standard
+    assert con.execute("SELECT date FROM weather_records ORDER BY id").fetchall() == [("2000-01-01",), ("garbage",)]
+
+
+def test_init_db_adds_missing_indexes(tmp_path):
+    db_path = tmp_path / "old.db"
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{db_path}"}
+
+    def init_db():
+        subprocess.run([sys.executable, "-m", "scripts.init_db"], cwd=ROOT, env=env, capture_output=True, check=True)
+
+    def record_indexes(con):
+        rows = con.execute("SELECT name FROM sqlite_master WHERE type = 'index' AND tbl_name = 'weather_records'")
+        return sorted(name for (name,) in rows if not name.startswith("sqlite_autoindex"))
+
+    init_db()
+    con = sqlite3.connect(db_path)
+    indexes = record_indexes(con)
+    assert indexes
+    # A database created before the indexes were added to the models
+    for name in indexes:
+        con.execute(f"DROP INDEX {name}")
+    con.commit()
+    assert record_indexes(con) == []
+
+    init_db()
+    assert record_indexes(con) == indexes
+    con.close()
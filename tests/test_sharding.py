@@ -0,0 +1,80 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+
+from scripts.gen_wx_data import generate
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in a fresh interpreter, since SHARD_COUNT is read at import time: prints API responses for
+# paging (offset and cursor), filters, stats with percentiles, batch, export and summary
+CHILD = r"""
+import json
+from fastapi.testclient import TestClient
+from app.main import app
+client = TestClient(app)
+out = {"pages": [], "offsets": []}
+cursor = None
+while True:
+    resp = client.get("/api/weather", params={"limit": 700, **({"cursor": cursor} if cursor else {})})
+    out["pages"].append(resp.json())
+    cursor = resp.headers.get("X-Next-Cursor")
+    if not cursor:
+        break
+for offset in (0, 13, 2500):
+    out["offsets"].append(client.get("/api/weather", params={"limit": 50, "offset": offset}).json())
+out["station"] = client.get("/api/weather", params={"station": "SYN00003", "start_date": "2000-02-01", "limit": 40}).json()
+out["on_date"] = client.get("/api/weather", params={"on_date": "1999-07-04"}).json()
+out["stats"] = [
+    client.get("/api/weather/stats", params={"granularity": g, "limit": 7, "offset": o}).json()
+    for g in ("year", "month", "decade") for o in (0, 5)
+]
+out["percentiles"] = client.get("/api/weather/stats", params={"year": 2000, "percentiles": "10,50,90"}).json()
+out["batch"] = client.post("/api/weather/batch", json={"selectors": [
+    {"station": "SYN00001", "limit": 3}, {"station": "NOPE", "limit": 3},
+    {"station": "SYN00004", "start_date": "2000-12-30", "limit": 5}, {"station": "SYN00001", "start_date": "2000-06-01", "limit": 2},
+]}).json()
+out["export"] = client.get("/api/weather/export", params={"format": "csv", "start_date": "2000-12-25"}).text
+out["summary"] = client.get("/api/weather/stats/summary", params={"top": 3}).json()
+print(json.dumps(out))
+"""
+
+
+def _run(tmp_path, name, shards, data_dir):
+    env = {**os.environ, "DATABASE_URL": f"sqlite:///{tmp_path / name}.db", "SHARD_COUNT": str(shards)}
+    env.pop("WEATHER_SNAPSHOT_DIR", None)
+    env.pop("DB_ASYNC", None)  # sharding runs the sync handlers
+
+    def run(*args):
+        return subprocess.run([sys.executable, *args], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+
+    run("-m", "scripts.ingest_weather", "--data-dir", str(data_dir))
+    run("-m", "scripts.compute_stats")
+    # Appended rows (some already ingested) go through the incremental path on both layouts
+    with open(data_dir / "SYN00002.txt", "a", encoding="utf-8") as f:
+        f.write("20001231\t1\t1\t1\n20010101\t50\t-50\t7\n")
+    run("-m", "scripts.ingest_weather", "--data-dir", str(data_dir), "--force")
+    run("-m", "scripts.compute_stats", "--incremental")
+    return json.loads(run("-c", CHILD).stdout)
+
+
+def test_sharded_results_match_single_db(tmp_path):
+    for name in ("single", "sharded"):
+        generate(tmp_path / f"data-{name}", stations=6, years=2, start_year=1999, seed=3)
+
+    single = _run(tmp_path, "single", 1, tmp_path / "data-single")
+    sharded = _run(tmp_path, "sharded", 3, tmp_path / "data-sharded")
+
+    # Stations really are spread out: several shard files hold records, the catalog holds none
+    counts = [
+        sqlite3.connect(tmp_path / f"sharded.shard{i}.db").execute("SELECT COUNT(*) FROM weather_records").fetchone()[0]
+        for i in range(3)
+    ]
+    assert sum(1 for n in counts if n) >= 2
+    catalog = sqlite3.connect(tmp_path / "sharded.db").execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    assert "weather_records" not in {name for (name,) in catalog}
+    assert sum(len(p) for p in single["pages"]) > 4000
+    assert single["percentiles"][0]["percentiles"]["tmax_c"]["50"] is not None
+    assert sharded == single
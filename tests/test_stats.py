@@ -1,6 +1,8 @@
+from datetime import date
 from app.database import SessionLocal
-from app.models import Station, WeatherRecord, WeatherStat
-from scripts.compute_stats import compute_and_upsert_stats
+from app.models import Station, WeatherRecord, WeatherStat, StatsDirty
+from scripts.compute_stats import compute_and_upsert_stats, compute_all_stats, compute_dirty_stats, STAT_COLUMNS
+from scripts.ingest_weather import ingest_file
 
 def test_stats_compute():
     with SessionLocal() as db:
@@ -12,9 +14,9 @@ def test_stats_compute():
         # - Year 2000: 2 days (both have temps, only first has precipitation)
         # - Year 2001: 1 day (only precipitation)
         recs = [
-            WeatherRecord(station_id=st.id, date="2000-01-01", tmax_tenths_c=100, tmin_tenths_c=0, prcp_tenths_mm=20),
-            WeatherRecord(station_id=st.id, date="2000-01-02", tmax_tenths_c=200, tmin_tenths_c=100, prcp_tenths_mm=None),
-            WeatherRecord(station_id=st.id, date="2001-05-01", tmax_tenths_c=None, tmin_tenths_c=None, prcp_tenths_mm=10),
+            WeatherRecord(station_id=st.id, date=date(2000, 1, 1), tmax_tenths_c=100, tmin_tenths_c=0, prcp_tenths_mm=20),
+            WeatherRecord(station_id=st.id, date=date(2000, 1, 2), tmax_tenths_c=200, tmin_tenths_c=100, prcp_tenths_mm=None),
+            WeatherRecord(station_id=st.id, date=date(2001, 5, 1), tmax_tenths_c=None, tmin_tenths_c=None, prcp_tenths_mm=10),
         ]
         db.add_all(recs); db.commit()
 
@@ -33,3 +35,56 @@ def test_stats_compute():
         assert s2001.avg_tmax_c is None and s2001.avg_tmin_c is None
         assert s2001.total_prcp_cm == 0.1  # 10 tenths mm = 1 mm = 0.1 cm
         assert s2001.count_prcp == 1
+
+
+def _stats_snapshot(db):
+    return {
+        (s.station_id, s.year): tuple(getattr(s, c) for c in STAT_COLUMNS)
+        for s in db.query(WeatherStat).all()
+    }
+
+
+def test_bulk_stats_match_per_station():
+    with SessionLocal() as db:
+        st = Station(code="STATBULK")
+        db.add(st); db.commit(); db.refresh(st)
+        db.add_all([
+            WeatherRecord(station_id=st.id, date=date(1999, 12, 31), tmax_tenths_c=-33, tmin_tenths_c=-71, prcp_tenths_mm=3),
+            WeatherRecord(station_id=st.id, date=date(2000, 3, 1), tmax_tenths_c=17, tmin_tenths_c=None, prcp_tenths_mm=0),
+            WeatherRecord(station_id=st.id, date=date(2000, 3, 2), tmax_tenths_c=29, tmin_tenths_c=-3, prcp_tenths_mm=None),
+        ])
+        db.commit()
+
+        for (sid,) in db.query(Station.id).all():
+            compute_and_upsert_stats(db, sid)
+        expected = _stats_snapshot(db)
+
+        # Wipe and recompute every station in one statement; values must be identical
+        db.query(WeatherStat).delete(); db.commit()
+        assert compute_all_stats(db) == len(expected)
+        assert _stats_snapshot(db) == expected
+
+
+def test_incremental_stats_only_dirty_years(tmp_path):
+    fpath = tmp_path / "STATINC.txt"
+    fpath.write_text("\n".join(["19991231\t10\t0\t5", "20000101\t20\t0\t5"]), encoding="utf-8")
+
+    with SessionLocal() as db:
+        ingest_file(db, "STATINC", str(fpath))
+        compute_all_stats(db)
+        assert db.query(StatsDirty).count() == 0
+        sid = db.query(Station.id).filter_by(code="STATINC").scalar()
+
+        # Append a day in 2000 only: just (station, 2000) becomes dirty
+        fpath.write_text(fpath.read_text() + "\n20000102\t40\t0\t5", encoding="utf-8")
+        ingest_file(db, "STATINC", str(fpath))
+        assert [(d.station_id, d.year) for d in db.query(StatsDirty).all()] == [(sid, 2000)]
+
+        assert compute_dirty_stats(db) == 1
+        assert db.query(StatsDirty).count() == 0
+        s2000 = db.query(WeatherStat).filter_by(station_id=sid, year=2000).one()
+        assert s2000.avg_tmax_c == 3.0 and s2000.count_tmax == 2
+
+        # No-op re-ingest leaves nothing to do
+        ingest_file(db, "STATINC", str(fpath))
+        assert compute_dirty_stats(db) == 0
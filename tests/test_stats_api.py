@@ -0,0 +1,165 @@
+from datetime import date
+from app.cache import stats_cache
+from app.database import SessionLocal
+from app.models import Station, WeatherRecord
+from scripts.compute_stats import compute_and_upsert_stats
+
+
+def test_stats_cache_etag_and_invalidation(client):
+    with SessionLocal() as db:
+        st = Station(code="CACHE001")
+        db.add(st); db.commit(); db.refresh(st)
+        db.add(WeatherRecord(station_id=st.id, date=date(1990, 6, 1), tmax_tenths_c=250, tmin_tenths_c=100, prcp_tenths_mm=5))
+        db.commit()
+        compute_and_upsert_stats(db, st.id)
+        sid = st.id
+
+    params = {"station": "CACHE001"}
+    first = client.get("/api/weather/stats", params=params)
+    assert first.headers["X-Cache"] == "MISS"
+    assert first.json()[0]["avg_tmax_c"] == 25.0
+    hits = stats_cache.info()["hits"]
+
+    second = client.get("/api/weather/stats", params=params)
+    assert second.headers["X-Cache"] == "HIT" and second.content == first.content
+    assert stats_cache.info()["hits"] == hits + 1
+    assert client.get("/api/weather/stats/cache").json()["hits"] == hits + 1
+
+    # Polling with the ETag gets 304 until stats are recomputed
+    etag = first.headers["ETag"]
+    assert client.get("/api/weather/stats", params=params, headers={"If-None-Match": etag}).status_code == 304
+
+    with SessionLocal() as db:
+        db.add(WeatherRecord(station_id=sid, date=date(1990, 6, 2), tmax_tenths_c=150, tmin_tenths_c=100, prcp_tenths_mm=5))
+        db.commit()
+        compute_and_upsert_stats(db, sid)
+
+    fresh = client.get("/api/weather/stats", params=params, headers={"If-None-Match": etag})
+    assert fresh.status_code == 200 and fresh.headers["X-Cache"] == "MISS"
+    assert fresh.headers["ETag"] != etag
+    assert fresh.json()[0]["avg_tmax_c"] == 20.0
+
+
+def test_stats_granularity_rollups(client):
+    with SessionLocal() as db:
+        st = Station(code="ROLL0001")
+        db.add(st); db.commit(); db.refresh(st)
+        db.add_all([
+            WeatherRecord(station_id=st.id, date=date(1991, 1, 5), tmax_tenths_c=100, tmin_tenths_c=0, prcp_tenths_mm=10),
+            WeatherRecord(station_id=st.id, date=date(1991, 2, 5), tmax_tenths_c=200, tmin_tenths_c=0, prcp_tenths_mm=None),
+            WeatherRecord(station_id=st.id, date=date(1998, 2, 5), tmax_tenths_c=300, tmin_tenths_c=None, prcp_tenths_mm=30),
+        ])
+        db.commit()
+        compute_and_upsert_stats(db, st.id)
+
+    months = client.get("/api/weather/stats", params={"station": "ROLL0001", "granularity": "month"}).json()
+    assert [(m["year"], m["month"], m["avg_tmax_c"]) for m in months] == [(1991, 1, 10.0), (1991, 2, 20.0), (1998, 2, 30.0)]
+    feb = client.get("/api/weather/stats", params={"station": "ROLL0001", "granularity": "month", "year": 1998}).json()
+    assert len(feb) == 1 and feb[0]["total_prcp_cm"] == 0.3
+
+    decades = client.get("/api/weather/stats", params={"station": "ROLL0001", "granularity": "decade", "year": 1995}).json()
+    assert decades == [{
+        "station": "ROLL0001", "decade": 1990, "avg_tmax_c": 20.0, "avg_tmin_c": 0.0, "total_prcp_cm": 0.4,
+        "count_tmax": 3, "count_tmin": 2, "count_prcp": 2,
+    }]
+    assert client.get("/api/weather/stats", params={"granularity": "week"}).status_code == 422
+
+
+def test_stats_summary_across_stations(client):
+    with SessionLocal() as db:
+        for code, prcp in (("SUMM0001", 50), ("SUMM0002", 300), ("SUMM0003", None)):
+            st = Station(code=code)
+            db.add(st); db.commit(); db.refresh(st)
+            db.add(WeatherRecord(station_id=st.id, date=date(1960, 7, 1), tmax_tenths_c=100, tmin_tenths_c=0, prcp_tenths_mm=prcp))
+            db.commit()
+            compute_and_upsert_stats(db, st.id)
+
+    resp = client.get("/api/weather/stats/summary", params={"metric": "total_prcp_cm", "year": 1960, "top": 5})
+    assert resp.status_code == 200
+    (summary,) = resp.json()
+    assert summary["year"] == 1960 and summary["stations"] == 2
+    assert summary["mean"] == 1.75 and summary["min"] == 0.5 and summary["max"] == 3.0
+    assert [(t["rank"], t["station"], t["value"]) for t in summary["top"]] == [(1, "SUMM0002", 3.0), (2, "SUMM0001", 0.5)]
+
+    asc = client.get("/api/weather/stats/summary", params={"metric": "total_prcp_cm", "year": 1960, "order": "asc", "top": 1})
+    assert [t["station"] for t in asc.json()[0]["top"]] == ["SUMM0001"]
+    # Years without data are simply absent
+    assert client.get("/api/weather/stats/summary", params={"year": 1900}).json() == []
+
+
+def test_stats_summary_on_empty_db(client, tmp_path, monkeypatch):
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+    from app import stats_matrix
+    from app.database import Base
+    from app.deps import get_db
+    from app.main import app
+
+    # Freshly initialised DB, compute_stats never ran
+    eng = create_engine(f"sqlite:///{tmp_path / 'empty.db'}")
+    Base.metadata.create_all(eng)
+    EmptySession = sessionmaker(bind=eng)
+
+    def empty_db():
+        with EmptySession() as db:
+            yield db
+
+    monkeypatch.setattr(stats_matrix, "_matrix", None)
+    app.dependency_overrides[get_db] = empty_db
+    try:
+        assert client.get("/api/weather/stats/summary").json() == []
+        assert client.get("/api/weather/stats/summary", params={"year": 1990}).json() == []
+    finally:
+        app.dependency_overrides.pop(get_db)
+        monkeypatch.setattr(stats_matrix, "_matrix", None)
+        eng.dispose()
+
+
+def test_stats_percentiles_from_sketches(client, tmp_path):
+    import numpy as np
+    from scripts.ingest_weather import ingest_file
+
+    rng = np.random.default_rng(7)
+    rows = [
+        (d, int(rng.integers(-100, 350)), int(rng.integers(-200, 150)), int(rng.integers(0, 40)))
+        for d in np.arange("2003-01-01", "2003-12-31", dtype="datetime64[D]").astype(object)
+    ]
+    rows[5] = (rows[5][0], -9999, rows[5][2], -9999)  # missing values are not sketched
+
+    def write(subset):
+        fpath.write_text("\n".join(
+            f"{d:%Y%m%d}\t{a}\t{b}\t{c}" for d, a, b, c in subset
+        ), encoding="utf-8")
+
+    fpath = tmp_path / "SKETCH01.txt"
+    params = {"station": "SKETCH01", "percentiles": "5,50,95,100"}
+
+    def ingest(subset):
+        write(subset)
+        with SessionLocal() as db:
+            ingest_file(db, "SKETCH01", str(fpath), batch_size=64)
+            compute_and_upsert_stats(db, db.query(Station).filter_by(code="SKETCH01").one().id)
+
+    def check(subset):
+        resp = client.get("/api/weather/stats", params=params)
+        assert resp.status_code == 200
+        got = resp.json()[0]["percentiles"]
+        for name, col in (("tmax_c", 1), ("tmin_c", 2), ("prcp_mm", 3)):
+            values = np.array([r[col] for r in subset if r[col] != -9999])
+            expected = np.percentile(values, [5, 50, 95, 100], method="inverted_cdf") / 10.0
+            assert list(got[name].values()) == expected.tolist()
+            assert list(got[name]) == ["5", "50", "95", "100"]
+
+    # Initial load, then an appended tail: the new days' sketches are merged into the stored ones
+    ingest(rows[:100])
+    ingest(rows[100:250])
+    check(rows[:250])
+    # A re-ingest overlapping both rebuilds the year's sketches from its records
+    ingest(rows)
+    check(rows)
+
+    assert "percentiles" not in client.get("/api/weather/stats", params={"station": "SKETCH01"}).json()[0]
+    bad = {"station": "SKETCH01", "percentiles": "101"}
+    assert client.get("/api/weather/stats", params=bad).status_code == 400
+    monthly = {"station": "SKETCH01", "percentiles": "50", "granularity": "month"}
+    assert client.get("/api/weather/stats", params=monthly).status_code == 400
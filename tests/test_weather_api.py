@@ -0,0 +1,243 @@
+import json
+from datetime import date
+from app.database import SessionLocal
+from app.models import Station, WeatherRecord
+
+
+def _seed_station(db, code, days):
+    st = Station(code=code)
+    db.add(st); db.commit(); db.refresh(st)
+    db.add_all([
+        WeatherRecord(station_id=st.id, date=date(1970, 1, d), tmax_tenths_c=d * 10, tmin_tenths_c=-d, prcp_tenths_mm=None)
+        for d in days
+    ])
+    db.commit()
+    return st
+
+
+def test_cursor_pagination_walks_all_rows_in_order(client):
+    with SessionLocal() as db:
+        _seed_station(db, "APIA0001", range(1, 6))
+        _seed_station(db, "APIA0002", range(3, 8))
+
+    params = {"start_date": "1970-01-01", "end_date": "1970-01-31", "limit": 3}
+    expected = client.get("/api/weather", params={**params, "limit": 1000}).json()
+    assert len(expected) == 10
+
+    seen, cursor = [], None
+    while True:
+        resp = client.get("/api/weather", params={**params, **({"cursor": cursor} if cursor else {})})
+        assert resp.status_code == 200
+        seen.extend(resp.json())
+        cursor = resp.headers.get("X-Next-Cursor")
+        if not cursor:
+            break
+    assert seen == expected
+    # Shared dates are ordered by station, deterministically
+    assert [(r["date"], r["station"]) for r in seen[2:4]] == [("1970-01-03", "APIA0001"), ("1970-01-03", "APIA0002")]
+
+
+def test_cursor_rejects_garbage_and_offset(client):
+    with SessionLocal() as db:
+        _seed_station(db, "APIC0001", range(1, 3))
+
+    assert client.get("/api/weather", params={"cursor": "not-a-cursor"}).status_code == 400
+    resp = client.get("/api/weather", params={"station": "APIC0001", "limit": 1})
+    cursor = resp.headers.get("X-Next-Cursor")
+    assert cursor
+    params = {"station": "APIC0001", "cursor": cursor}
+    assert client.get("/api/weather", params=params).status_code == 200
+    assert client.get("/api/weather", params={**params, "offset": 5}).status_code == 400
+
+
+def test_export_matches_list_endpoint(client):
+    with SessionLocal() as db:
+        _seed_station(db, "APIE0001", range(10, 14))
+    params = {"station": "APIE0001"}
+    listed = client.get("/api/weather", params=params).json()
+
+    resp = client.get("/api/weather/export", params=params)
+    assert resp.status_code == 200
+    assert resp.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line) for line in resp.text.splitlines()] == listed
+
+    resp = client.get("/api/weather/export", params={**params, "format": "csv"})
+    lines = resp.text.splitlines()
+    assert lines[0] == "station,date,tmax_c,tmin_c,prcp_mm"
+    assert lines[1] == "APIE0001,1970-01-10,10.0,-1.0,"
+    assert len(lines) == 1 + len(listed)
+
+
+def test_snapshot_reads_match_db(client, tmp_path, monkeypatch):
+    import app.snapshot as snapshot
+    with SessionLocal() as db:
+        _seed_station(db, "APIS0001", [1, 2, 4, 8, 16])
+        db.add(WeatherRecord(station_id=db.query(Station.id).filter_by(code="APIS0001").scalar(),
+                             date=date(1970, 2, 1), tmax_tenths_c=None, tmin_tenths_c=None, prcp_tenths_mm=7))
+        db.commit()
+
+    cases = [
+        {"station": "APIS0001"},
+        {"station": "APIS0001", "start_date": "1970-01-02", "end_date": "1970-01-10"},
+        {"station": "APIS0001", "on_date": "1970-01-04"},
+        {"station": "APIS0001", "limit": 2, "offset": 3},
+        {"station": "APIS0001", "limit": 2},
+    ]
+
+    def fetch(params):
+        resp = client.get("/api/weather", params=params)
+        return resp.json(), resp.headers.get("X-Next-Cursor")
+
+    expected = [fetch(p) for p in cases]
+    cursor = expected[-1][1]
+    expected_next = fetch({"station": "APIS0001", "limit": 2, "cursor": cursor})
+
+    with SessionLocal() as db:
+        assert snapshot.build_snapshot(db, str(tmp_path / "snap")) > 0
+    monkeypatch.setattr(snapshot, "SNAPSHOT_DIR", str(tmp_path / "snap"))
+    assert snapshot.get_snapshot() is not None
+
+    assert [fetch(p) for p in cases] == expected
+    assert fetch({"station": "APIS0001", "limit": 2, "cursor": cursor}) == expected_next
+    # Stations missing from the snapshot fall back to the DB
+    assert snapshot.get_snapshot().query("NOPE", None, None, None, None, 10) is None
+
+
+def test_snapshot_ignores_rows_written_during_build(client, tmp_path):
+    import sqlite3
+    from sqlalchemy import event
+    import app.snapshot as snapshot
+    from app.database import engine
+
+    with SessionLocal() as db:
+        st = _seed_station(db, "APIS0002", range(1, 4))
+        station_id = st.id
+
+    # Commit a new row from another connection right after the COUNT(*) that sizes the arrays
+    inserted = []
+
+    def insert_after_count(conn, cursor, statement, parameters, context, executemany):
+        if not inserted and "count(*)" in statement.lower() and "weather_records" in statement:
+            inserted.append(True)
+            other = sqlite3.connect(engine.url.database)
+            other.execute(
+                "INSERT INTO weather_records (station_id, date, tmax_tenths_c) VALUES (?, '1970-02-01', 1)", (station_id,)
+            )
+            other.commit()
+            other.close()
+
+    event.listen(engine, "after_cursor_execute", insert_after_count)
+    try:
+        with SessionLocal() as db:
+            total = snapshot.build_snapshot(db, str(tmp_path / "snap"))
+    finally:
+        event.remove(engine, "after_cursor_execute", insert_after_count)
+    assert inserted
+
+    # The build saw one consistent state: the late row is absent, not a zero-filled or overflowing slot
+    snap = snapshot.Snapshot(str(tmp_path / "snap"))
+    assert total == len(snap.days)
+    rows = snap.query("APIS0002", None, None, None, None, 10)
+    assert [r[1].day for r in rows] == [1, 2, 3]
+
+
+def test_batch_matches_per_station_queries(client):
+    with SessionLocal() as db:
+        _seed_station(db, "APIB0001", range(1, 11))
+        _seed_station(db, "APIB0002", range(5, 9))
+
+    selectors = [
+        {"station": "APIB0001", "start_date": "1970-01-03", "end_date": "1970-01-06"},
+        {"station": "APIB0002"},
+        {"station": "NOPE0000"},
+        {"station": "APIB0001", "start_date": "1970-01-02", "limit": 3},
+    ]
+    resp = client.post("/api/weather/batch", json={"selectors": selectors})
+    assert resp.status_code == 200
+    body = resp.json()
+    assert body["unknown_stations"] == ["NOPE0000"]
+    results = body["results"]
+    assert [r["station"] for r in results] == ["APIB0001", "APIB0002", "NOPE0000", "APIB0001"]
+
+    def single(**params):
+        return client.get("/api/weather", params=params).json()
+
+    assert results[0]["records"] == single(station="APIB0001", start_date="1970-01-03", end_date="1970-01-06")
+    assert results[0]["next_start_date"] is None
+    assert results[1]["records"] == single(station="APIB0002")
+    assert results[2]["records"] == []
+    # Truncated selector: the next page starts the day after the last record
+    assert results[3]["records"] == single(station="APIB0001", start_date="1970-01-02", limit=3)
+    assert results[3]["next_start_date"] == "1970-01-05"
+
+    assert client.post("/api/weather/batch", json={"selectors": []}).status_code == 422
+
+
+def test_list_json_same_without_orjson(client, monkeypatch):
+    import app.utils as utils
+    with SessionLocal() as db:
+        _seed_station(db, "APIJ0001", [3, 4])
+    params = {"station": "APIJ0001"}
+    fast = client.get("/api/weather", params=params)
+    monkeypatch.setattr(utils, "orjson", None)
+    slow = client.get("/api/weather", params=params)
+    assert fast.content == slow.content
+    assert fast.json()[0] == {"station": "APIJ0001", "date": "1970-01-03", "tmax_c": 3.0, "tmin_c": -0.3, "prcp_mm": None}
+
+
+def test_ready_after_warmup_and_station_index(client):
+    import time
+    from fastapi.testclient import TestClient
+    from app.main import app
+    from app.stations import station_index
+
+    with SessionLocal() as db:
+        st = Station(code="WARM0001")
+        db.add(st); db.commit(); db.refresh(st)
+        db.add(WeatherRecord(station_id=st.id, date=date(2001, 5, 1), tmax_tenths_c=200, tmin_tenths_c=50, prcp_tenths_mm=0))
+        db.commit()
+        warm_id = st.id
+
+    # The lifespan runs the warm-up in the background; /ready reports 503 until it is done
+    with TestClient(app) as c:
+        deadline = time.monotonic() + 30
+        while (resp := c.get("/ready")).status_code != 200 and time.monotonic() < deadline:
+            assert resp.status_code == 503 and resp.json()["status"] in ("pending", "running")
+            time.sleep(0.02)
+        info = resp.json()
+        assert info["status"] == "ready" and info["stations"] >= 1 and info["statements"] > 0
+
+    assert station_index.get("WARM0001") == warm_id
+    expected = [{"station": "WARM0001", "date": "2001-05-01", "tmax_c": 20.0, "tmin_c": 5.0, "prcp_mm": 0.0}]
+    assert client.get("/api/weather", params={"station": "WARM0001"}).json() == expected
+
+    # Stations created after warm-up are not in the index and fall back to the code filter
+    with SessionLocal() as db:
+        late = Station(code="WARM0002")
+        db.add(late); db.commit(); db.refresh(late)
+        db.add(WeatherRecord(station_id=late.id, date=date(2001, 5, 2), tmax_tenths_c=10, tmin_tenths_c=0, prcp_tenths_mm=1))
+        db.commit()
+    assert station_index.get("WARM0002") is None
+    assert [r["date"] for r in client.get("/api/weather", params={"station": "WARM0002"}).json()] == ["2001-05-02"]
+    batch = client.post("/api/weather/batch", json={"selectors": [{"station": "WARM0001"}, {"station": "WARM0002"}]}).json()
+    assert [len(r["records"]) for r in batch["results"]] == [1, 1] and batch["unknown_stations"] == []
+
+
+def test_stale_station_index_never_returns_other_stations(client, monkeypatch):
+    from app.stations import station_index
+    from scripts.compute_stats import compute_and_upsert_stats
+
+    with SessionLocal() as db:
+        _seed_station(db, "APIX0001", range(1, 4))
+        other_id = _seed_station(db, "APIX0002", range(1, 6)).id
+        compute_and_upsert_stats(db, other_id)
+
+    # Index loaded before APIX0001 was recreated: its cached id now belongs to APIX0002
+    monkeypatch.setattr(station_index, "_ids", {"APIX0001": other_id})
+    params = {"station": "APIX0001"}
+    assert all(r["station"] == "APIX0001" for r in client.get("/api/weather", params=params).json())
+    assert all(line.startswith("APIX0001,") for line in client.get(
+        "/api/weather/export", params={**params, "format": "csv"}).text.splitlines()[1:])
+    assert all(r["station"] == "APIX0001" for r in client.get("/api/weather/stats", params=params).json())
+    batch = client.post("/api/weather/batch", json={"selectors": [params]}).json()
+    assert [r["date"] for r in batch["results"][0]["records"]] == ["1970-01-01", "1970-01-02", "1970-01-03"]